@@ -0,0 +1,77 @@
+import nanogds
+
+from .designs import count, get_feedline, get_meander
+
+
+class CoplanarPath:
+    params = [10, 50, 200]
+    param_names = ["turns"]
+
+    def setup(self, turns):
+        self.polygons, self.vertices = count(get_meander(turns).get_shape())
+
+    def time_build(self, turns):
+        get_meander(turns)
+
+    def time_get_shape(self, turns):
+        get_meander(turns).get_shape().polygons
+
+    def peakmem_get_shape(self, turns):
+        get_meander(turns).get_shape().polygons
+
+    def track_polygons(self, turns):
+        return self.polygons
+
+    track_polygons.unit = "polygons"
+
+    def track_vertices(self, turns):
+        return self.vertices
+
+    track_vertices.unit = "vertices"
+
+
+class Feedline:
+    params = [False, True]
+    param_names = ["invert"]
+
+    def setup(self, invert):
+        self.feedline = get_feedline(invert)
+        self.polygons, self.vertices = count(self.feedline.get_shape())
+
+    def time_get_shape(self, invert):
+        self.feedline.get_shape().polygons
+
+    def time_get_shape_tiled(self, invert):
+        self.feedline.get_shape(tiles=(8, 4)).polygons
+
+    def time_add_hole_array(self, invert):
+        get_feedline(invert).add_hole_array(pitch=20, size=5, keepout=3)
+
+    def peakmem_get_shape(self, invert):
+        self.feedline.get_shape().polygons
+
+    def track_polygons(self, invert):
+        return self.polygons
+
+    track_polygons.unit = "polygons"
+
+    def track_vertices(self, invert):
+        return self.vertices
+
+    track_vertices.unit = "vertices"
+
+
+class LCFilter:
+    def setup(self):
+        self.lc_filter = nanogds.LCFilter(2, 2, 50, 10, 5, 1, 100)
+
+    def time_build(self):
+        nanogds.LCFilter(2, 2, 50, 10, 5, 1, 100)
+
+    def time_get_shape(self):
+        self.lc_filter.get_shape().polygons
+
+    def track_vertices(self):
+        return count(self.lc_filter.get_shape())[1]
+
+    track_vertices.unit = "vertices"
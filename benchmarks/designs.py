@@ -0,0 +1,43 @@
+import nanogds
+import numpy as np
+
+PI = np.pi
+
+
+def get_feedline(invert=False):
+    # feedline with bondpads of the HighZ test chips, see examples/07_HighZ_Tests
+    feedline = nanogds.CoplanarShape(invert=invert)
+    bondpad = nanogds.Bondpad(500, 500, 10, 400, 250, 4, 20).rotate(-PI / 2)
+    path = nanogds.CoplanarPath(250, 4, 400, 20)
+    path.segment(2200, "+x")
+    path.turn("l")
+    path.segment(200)
+    path.combine(
+        bondpad, position=path.points["END"], connect_point=bondpad.points["END"]
+    )
+    feedline.combine(path)
+    feedline.combine(path.mirror([0, 1]))
+    return feedline
+
+
+def get_meander(turns):
+    path = nanogds.CoplanarPath(10, 6, 60, 20)
+    path.segment(200, "+x")
+    for i in range(turns):
+        path.turn("l" if i % 4 < 2 else "r")
+        path.segment(100 if i % 2 else 400)
+    return path
+
+
+def get_marker_chip(n=10):
+    # die built by `MaskTemplate.populate`, has to be importable by the workers
+    shape = nanogds.Shape()
+    shape.add(nanogds.MarkerField(5, n, n, 200, label=True), position=(-1000, -1000))
+    shape.add(nanogds.Rectangle(4000, 4000, layer=1), position=(-2000, -2000))
+    return shape
+
+
+def count(shape):
+    # polygons and vertices of the flat geometry
+    polygons = [p for layer_polygons in shape.polygons for p in layer_polygons]
+    return len(polygons), sum(len(p) for p in polygons)
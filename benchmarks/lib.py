@@ -0,0 +1,68 @@
+import gdspy
+import nanogds
+import os
+import tempfile
+
+from .designs import get_feedline, get_marker_chip
+
+
+class GDSSave:
+    params = [False, True]
+    param_names = ["streaming"]
+
+    def setup(self, streaming):
+        self.directory = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.directory.name, "chip")
+
+    def teardown(self, streaming):
+        self.directory.cleanup()
+
+    def _write(self, streaming):
+        lib = nanogds.GDS()
+        if streaming:
+            lib.stream(self.name)
+        lib.add("FEEDLINE", get_feedline(invert=True).get_shape())
+        lib.add("MARKERS", get_marker_chip(20))
+        lib.save(self.name, streaming=streaming)
+
+    def time_save(self, streaming):
+        self._write(streaming)
+
+    def peakmem_save(self, streaming):
+        self._write(streaming)
+
+    def track_file_size(self, streaming):
+        self._write(streaming)
+        return os.path.getsize(f"{self.name}.gds")
+
+    track_file_size.unit = "bytes"
+
+
+class MaskTemplate:
+    params = [4, 16]
+    param_names = ["dies"]
+    timeout = 300
+
+    def setup(self, dies):
+        self.directory = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.directory.name, "mask")
+
+    def teardown(self, dies):
+        self.directory.cleanup()
+
+    def _populate(self, dies):
+        # the template's cells are also added to `gdspy.current_library`
+        gdspy.current_library = gdspy.GdsLibrary()
+        template = nanogds.MaskTemplate("wafer_template_5x8mm")
+        names = [d.name for d in template.find_dies()][:dies]
+        template.populate({name: {} for name in names}, get_marker_chip, workers=1)
+        return template
+
+    def time_populate(self, dies):
+        self._populate(dies)
+
+    def time_write(self, dies):
+        self._populate(dies).write(self.name)
+
+    def peakmem_write(self, dies):
+        self._populate(dies).write(self.name)
@@ -0,0 +1,39 @@
+import nanogds
+
+from .designs import count
+
+
+class MarkerField:
+    params = [5, 10, 20, 40]
+    param_names = ["n"]
+
+    def setup(self, n):
+        self.polygons, self.vertices = count(self._build(n))
+
+    def _build(self, n):
+        return nanogds.MarkerField(5, n, n, 200, label=True)
+
+    def time_build(self, n):
+        self._build(n).polygons
+
+    def peakmem_build(self, n):
+        self._build(n).polygons
+
+    def track_polygons(self, n):
+        return self.polygons
+
+    track_polygons.unit = "polygons"
+
+    def track_vertices(self, n):
+        return self.vertices
+
+    track_vertices.unit = "vertices"
+
+
+class HierarchicalMarkerField:
+    params = [10, 40]
+    param_names = ["n"]
+
+    def time_build(self, n):
+        field = nanogds.MarkerField(5, n, n, 200, hierarchical=True)
+        nanogds.GDS().add("FIELD", field)
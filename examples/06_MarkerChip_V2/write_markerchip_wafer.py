@@ -169,7 +169,7 @@ if __name__ == "__main__":
 
     base_name = "1"
 
-    refs = [ref.ref_cell.name for ref in wafer._lib.cells["Template"].references]
+    refs = [name for name, origin in wafer.placements]
     for i, ref in enumerate(refs[1:89]):
         name = base_name + "A" + str(i + 1)
         shape = deepcopy(markerchip_v1_shape)
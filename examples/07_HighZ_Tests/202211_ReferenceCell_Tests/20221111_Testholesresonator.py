@@ -216,85 +216,8 @@ if __name__ == "__main__":
     #shape = shape.get_shape(verbose=True)
     
     
-    # add holes to ground plane
-    R1 = gdspy.Rectangle((-0.5, -0.5), (0.5, 0.5))
-    
-    rectangle = gdspy.Cell("RECTANGLE")
-    rectangle.add(R1)
-    
+    # add holes to ground plane, each row of holes is one cell array
+    shape.add_hole_array(pitch=2, size=1, keepout=2)
 
-    chip_x = 6000
-    chip_y = 4000
-    hole_spacing = 2
-    x = np.arange(-chip_x/2,chip_x/2,hole_spacing)
-    y = np.arange(-chip_y/2,chip_y/2,hole_spacing)
-    
-    x_array, y_array = np.meshgrid(x,y)
-#    print(array)
-    position = np.array([x_array.ravel(), y_array.ravel()]).T
-
-    checking_array = np.asarray([[-hole_spacing,-hole_spacing],[-hole_spacing,hole_spacing], [hole_spacing,-hole_spacing], [hole_spacing,hole_spacing]])
-    
-    pos_checking_array = np.asarray([pos + checking_array for pos in position])
-    
-    
-    
-    polygon_ground = None
-    for i in range(len(feedline._ground)):
-        if isinstance(feedline._ground[i], gdspy.polygon.Path):
-            polygon_ground = gdspy.boolean(polygon_ground, feedline._ground[i], operation='or')
-        else:
-            poly = gdspy.Polygon(feedline._ground[i].polygons[0][0])
-            polygon_ground = gdspy.boolean(polygon_ground, poly, operation='or')
-            
-            
-    polygon_outer = None
-    for i in range(len(feedline._outer)):
-        if isinstance(feedline._outer[i], gdspy.polygon.Path):
-            polygon_outer = gdspy.boolean(polygon_outer, feedline._outer[i], operation='or')
-        else:
-            poly = gdspy.Polygon(feedline._outer[i].polygons[0][0])
-            polygon_outer = gdspy.boolean(polygon_outer, poly, operation='or')
-            
-    polygon_holes = gdspy.boolean(polygon_ground, polygon_outer, operation='not')
-        
-    
-    result = gdspy.inside(pos_checking_array, polygon_holes, short_circuit='all')
-    
-    polygon_center = None
-    for i in range(len(feedline._center)):
-        if isinstance(feedline._center[i], (gdspy.polygon.Path, gdspy.FlexPath)):
-            polygon_center = gdspy.boolean(polygon_center, feedline._center[i], operation='or')
-        else:
-            poly = gdspy.Polygon(feedline._center[i].polygons[0][0])
-            polygon_center = gdspy.boolean(polygon_center, poly, operation='or')
-            
-    polygon_design = gdspy.boolean(polygon_outer, polygon_center, operation='not')
-    
-    
-#    print(feedline._ground[4].polygons[0][0])
-#    print(feedline._ground[5].polygons[0][0])
-#    
-#    test = gdspy.Polygon(feedline._ground[5].polygons[0][0])
-#    polygon_ground = gdspy.boolean(feedline._ground[2], test, operation='or')
-#    print(polygon_ground)
-
-    holes_cell = gdspy.Cell("HOLES")
-    for i in range(len(result)):
-        if result[i]:
-            holes_cell.add(gdspy.CellReference(rectangle, origin = (position[i][0],position[i][1])))
-
-
-#    design = gdspy.Cell("DESIGN")
-#    design.add(shape)
-#            
-    final = gdspy.Cell("FINAL")
-#    final.add(gdspy.CellReference(design))
-    final.add(polygon_design)
-    final.add(gdspy.CellReference(holes_cell))
-
-
-    
-    #lib.add("BLA", shape)
-    lib.add("TEST", final)
+    lib.add("TEST", shape.get_shape())
     lib.save("20221111_add_holes_1")
@@ -1,4 +1,4 @@
-from .base import GDS, MaskTemplate, Shape, CoplanarShape
+from .base import GDS, MaskTemplate, Shape, CoplanarShape, ShapeCache, ShapeMemo, Profile
 from .shapes import (
     Circle,
     Square,
@@ -3,3 +3,6 @@ from .shape import Shape
 from .coplanar_shape import CoplanarShape
 from .reference import Reference
 
+from .cache import ShapeCache
+from .parametric import ShapeMemo
+from .profiling import Profile
@@ -0,0 +1,36 @@
+import numpy as np
+
+# GDS database unit in user units; deviations below it are lost when the
+# polygons are written, so tolerances are not made any smaller
+GRID = 1e-3
+
+
+def get_options(tolerance):
+    # keyword arguments for `gdspy.Round` and `gdspy.Path.turn`/`arc`, the
+    # defaults of `gdspy` if no tolerance is set
+    if tolerance is None:
+        return {}
+    return {"tolerance": max(tolerance, GRID)}
+
+
+def get_fillet_options(radius, tolerance):
+    # keyword arguments for `gdspy.PolygonSet.fillet`: enough points per
+    # full circle for chords within `tolerance` of the largest radius
+    if tolerance is None:
+        return {}
+    radius = np.max(radius)
+    if radius <= 0:
+        return {}
+    step = 2 * np.arccos(1 - min(max(tolerance, GRID) / radius, 1))
+    return {"points_per_2pi": max(4, int(np.ceil(2 * np.pi / step)))}
+
+
+def get_counts(layer_polygons):
+    # {layer: {"polygons": n, "vertices": m}}
+    return {
+        layer: {
+            "polygons": len(polygons),
+            "vertices": int(sum(len(p) for p in polygons)),
+        }
+        for layer, polygons in layer_polygons.items()
+    }
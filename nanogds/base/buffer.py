@@ -0,0 +1,52 @@
+import numpy as np
+
+from . import packing, transform
+
+
+class PolygonBuffer:
+    # Polygons stored as one vertex array with the offsets of the polygons
+    # and an integer tag per polygon. Appended polygons are kept as separate
+    # chunks until the buffer is transformed, which joins them and applies
+    # the matrix in one operation. The arrays are never changed in place, so
+    # views handed out stay valid.
+    def __init__(self):
+        self._chunks = []  # (vertices, offsets, tags)
+        self.size = 0  # number of polygons
+
+    def append(self, polygons, tags, matrix=None):
+        # returns the index of the first polygon and views of the polygons
+        vertices, offsets = packing.pack(polygons)
+        if len(vertices):
+            vertices = transform.apply(matrix, [vertices])[0]
+        self._chunks.append((vertices, offsets, np.asarray(tags, dtype=int)))
+        first, self.size = self.size, self.size + len(polygons)
+        return first, packing.unpack(vertices, offsets)
+
+    def transform(self, matrix, tags=None):
+        # transforms the polygons with one of the `tags` (all if None) and
+        # returns views of all polygons
+        vertices, offsets, polygon_tags = self._join()
+        if transform.is_identity(matrix):
+            return packing.unpack(vertices, offsets)
+        result = transform.apply(matrix, [vertices])[0]
+        if tags is not None:
+            fixed = ~np.isin(polygon_tags, tags)
+            if fixed.any():
+                fixed = np.repeat(fixed, np.diff(offsets))
+                result[fixed] = vertices[fixed]
+        self._chunks = [(result, offsets, polygon_tags)]
+        return packing.unpack(result, offsets)
+
+    def _join(self):
+        if not self._chunks:
+            return np.zeros((0, 2)), np.zeros(1, dtype=int), np.zeros(0, dtype=int)
+        if len(self._chunks) > 1:
+            counts = np.concatenate([np.diff(c[1]) for c in self._chunks])
+            self._chunks = [
+                (
+                    np.concatenate([c[0] for c in self._chunks]),
+                    np.concatenate([[0], np.cumsum(counts)]),
+                    np.concatenate([c[2] for c in self._chunks]),
+                )
+            ]
+        return self._chunks[0]
@@ -0,0 +1,141 @@
+import hashlib
+import importlib
+import os
+import pickle
+import re
+import numpy as np
+
+from .parametric import construction_key
+
+FORMAT = 2  # increase when the stored state changes
+
+_source_digest = None
+
+
+def _get_source_digest():
+    # hash of the package sources, so that entries are rebuilt after any change
+    # of the drawing code, also in a source checkout without a version
+    global _source_digest
+    if _source_digest is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha1()
+        for directory, subdirectories, filenames in sorted(os.walk(root)):
+            subdirectories.sort()
+            for filename in sorted(f for f in filenames if f.endswith(".py")):
+                path = os.path.join(directory, filename)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+class ShapeCache:
+    # Persistent cache of built shapes, one `.npz` file per class and
+    # constructor arguments. Files are evicted least recently used first once
+    # the directory grows beyond `max_size` bytes.
+    def __init__(self, directory, max_size=2 ** 30):
+        self._directory = os.path.expanduser(directory)
+        self._max_size = max_size
+        os.makedirs(self._directory, exist_ok=True)
+        self._size = sum(f[1] for f in self._get_files())  # bytes, as tracked
+
+    def load(self, key):
+        path = self._get_path(key)
+        try:
+            with np.load(path) as data:
+                state = dict(data)
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(path)  # mark as recently used
+        module, qualname = str(state.pop("class")).split(":")
+        cls = importlib.import_module(module)
+        for name in qualname.split("."):
+            cls = getattr(cls, name)
+        shape = cls.__new__(cls)
+        shape._set_state(state)
+        shape._key = key
+        return shape
+
+    def store(self, key, shape):
+        try:
+            state = shape._get_state(children=True)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return  # attributes that cannot be pickled, e.g. open files
+        cls = type(shape)
+        state["class"] = np.array(f"{cls.__module__}:{cls.__qualname__}")
+        path = self._get_path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **state)
+        size = os.path.getsize(temporary)
+        if os.path.exists(path):
+            size -= os.path.getsize(path)
+        os.replace(temporary, path)  # atomic, other processes may read
+        self._size += size
+        if self._size > self._max_size:
+            self._evict()
+
+    def cached(self, function):
+        # decorator for functions returning a shape, e.g. example helpers
+        def wrapper(*args, **kwargs):
+            key = construction_key(function, args, kwargs)
+            if key is None:
+                return function(*args, **kwargs)
+            shape = self.load(key)
+            if shape is None:
+                shape = function(*args, **kwargs)
+                self.store(key, shape)
+            return shape
+
+        wrapper.__name__ = function.__name__
+        wrapper.__qualname__ = function.__qualname__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    def invalidate(self, name=None):
+        # removes all entries, or those of one class or function name
+        for filename in self._get_filenames():
+            if name is None or filename.startswith(f"{_sanitize(name)}-"):
+                os.remove(os.path.join(self._directory, filename))
+        self._size = sum(f[1] for f in self._get_files())
+
+    def _get_path(self, key):
+        digest = hashlib.sha1(
+            repr((FORMAT, _get_source_digest(), key)).encode()
+        ).hexdigest()
+        return os.path.join(self._directory, f"{_sanitize(key[1])}-{digest}.npz")
+
+    def _get_filenames(self):
+        return [f for f in os.listdir(self._directory) if f.endswith(".npz")]
+
+    def _get_files(self):
+        # (modification time, size, path) of the entries
+        files = []
+        for filename in self._get_filenames():
+            path = os.path.join(self._directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self):
+        # the directory is only listed once the tracked size exceeds the limit,
+        # it may also contain entries of other processes
+        files = self._get_files()
+        size = sum(f[1] for f in files)
+        for _, file_size, path in sorted(files):
+            if size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= file_size
+        self._size = size
+
+
+def _sanitize(name):
+    return re.sub(r"[^A-Za-z0-9_.]", "_", name)
@@ -1,14 +1,25 @@
+import copyreg
 import gdspy
 import nanogds
 import numpy as np
-from copy import deepcopy
 
-from .shape import Shape
+from . import arcs, packing, profiling, raster, spatial, transform
+from .buffer import PolygonBuffer
+from .parametric import Parametric
+from .shape import Shape, _from_bytes
 from .reference import Reference
+from copy import deepcopy
 from gdspy import clipper
 
+ROLES = ["center", "outer", "ground", "holes", "hole_arrays"]
+HOLES_PER_TILE = 100  # holes cut out of the ground plane per boolean
+
+
+class CoplanarShape(metaclass=Parametric):
+    cache = None  # `ShapeCache` used for subclasses built with arguments
+    cacheable = True
+    tolerance = None  # maximum chord error of arcs, None for the gdspy defaults
 
-class CoplanarShape:
     def __init__(self, layer=0, invert=False):
         self._reference = Reference()
         self.add_reference("ORIGIN", [0, 0])
@@ -16,6 +27,11 @@ class CoplanarShape:
         self._outer = []
         self._ground = []
         self._holes = []
+        self._hole_arrays = []  # holes in the ground plane, see `add_hole_array`
+        # polygons of combined `gdspy` elements, see `combine`; the names are
+        # kept distinct from attributes of subclasses
+        self._polygon_buffer = PolygonBuffer()
+        self._packed_elements = []  # [element, views, first polygon]
         self._draw()
         self._layer = layer
         self._invert = invert
@@ -32,108 +48,186 @@ class CoplanarShape:
     def add_to_holes(self, shape):
         self._holes.append(shape)
 
-    def get_shape(self, verbose=False):
-        shape = nanogds.Shape()
+    def add_hole_array(self, pitch, size, keepout=0, layer=0):
+        # square holes of `size` on a grid with `pitch` in the ground plane
+        # (ground NOT outer), at least `keepout` away from its edges; rows of
+        # holes covering the same columns are placed as one cell array
+        ground = self._get_role_polygons(self._ground, 0).values()
+        outer = self._get_role_polygons(self._outer, self._layer).values()
+        region = gdspy.boolean(
+            [p for polygons in ground for p in polygons],
+            [p for polygons in outer for p in polygons],
+            "not",
+        )
+        if region is not None:
+            region = gdspy.offset(region, -(keepout + size / np.sqrt(2)))
+        holes = nanogds.Shape()
+        if region is not None:
+            hole = nanogds.Square(size, layer=layer)
+            runs = raster.get_runs(region.polygons, pitch)
+            for row, column, rows, columns in raster.merge_runs(runs).T:
+                holes.add_array(
+                    hole,
+                    columns,
+                    rows,
+                    (pitch, pitch),
+                    position=(column * pitch - size / 2, row * pitch - size / 2),
+                )
+        self._hole_arrays.append(holes)
+        return holes
+
+    def get_shape(self, verbose=False, tiles=None, workers=1):
         if not self._invert:
-            if self._ground:
-                if verbose:
-                    print(f"** Adding {len(self._ground)} elements to ground")
-                for i, s in enumerate(self._ground):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._ground)}")
-                    shape.add(s)
-            if self._outer:
-                if verbose:
-                    print(f"** Adding {len(self._outer)} elements to outer")
-                for i, s in enumerate(self._outer):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._outer)}")
-                    shape.add(s, layer=self._layer, operation="not")
-            if self._center:
-                if verbose:
-                    print(f"** Adding {len(self._center)} elements to center")
-                for i, s in enumerate(self._center):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._center)}")
-                    shape.add(s, layer=self._layer)
+            roles = [
+                ("ground", self._ground, 0, "or"),
+                ("outer", self._outer, self._layer, "not"),
+                ("center", self._center, self._layer, "or"),
+                ("hole_arrays", self._hole_arrays, 0, "not"),
+            ]
         else:
-            if self._holes:
-                if verbose:
-                    print(f"** Adding {len(self._holes)} elements to holes")
-                for i, s in enumerate(self._holes):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._holes)}")
-                    shape.add(s)
-            if self._ground:
-                if verbose:
-                    print(f"** Adding {len(self._ground)} elements to ground")
-                for i, s in enumerate(self._ground):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._ground)}")
-                    shape.add(s, operation="not")
-            if self._outer:
-                if verbose:
-                    print(f"** Adding {len(self._outer)} elements to outer")
-                for i, s in enumerate(self._outer):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._outer)}")
-                    shape.add(s, layer=self._layer)
-            if self._center:
-                if verbose:
-                    print(f"** Adding {len(self._center)} elements to center")
-                for i, s in enumerate(self._center):
-                    if verbose and not i % 10:
-                        print(f"     * {i} / {len(self._center)}")
-                    shape.add(s, layer=self._layer, operation="not")
+            # the holes do not overlap with the outer region, so adding them
+            # last keeps them as cell arrays
+            roles = [
+                ("holes", self._holes, 0, "or"),
+                ("ground", self._ground, 0, "not"),
+                ("outer", self._outer, self._layer, "or"),
+                ("center", self._center, self._layer, "not"),
+                ("hole_arrays", self._hole_arrays, 0, "or"),
+            ]
+        roles = [role for role in roles if role[1]]
+        shape = nanogds.Shape()
+        shape.tiles, shape.workers = tiles, workers
+        for i, (name, elements, layer, operation) in enumerate(roles):
+            if verbose:
+                print(f"** Adding {len(elements)} elements to {name}")
+            if i == len(roles) - 1 and operation == "or":
+                # nothing is subtracted afterwards, so cell references survive
+                for s in elements:
+                    if isinstance(s, Shape) and s._children:
+                        shape.add(s)
+                elements = [
+                    s for s in elements if not (isinstance(s, Shape) and s._children)
+                ]
+            # all elements of a role enter a single boolean per layer
+            start = profiling.start()
+            role_polygons = self._get_role_polygons(elements, layer)
+            if start is not None:
+                role = f"{type(self).__name__}.{name}"
+                profiling.record(
+                    "get_shape", role, layer, start, outputs=role_polygons.values()
+                )
+            for l, polygons in role_polygons.items():
+                if name == "hole_arrays" and not self._invert:
+                    _cut_holes(shape, polygons, l)
+                else:
+                    shape._add_polygonset(polygons, layer=l, operation=operation)
         return shape
 
+    def _get_role_polygons(self, elements, layer):
+        role_polygons = {}
+        for s in elements:
+            if isinstance(s, Shape):
+                for l, polygons in s._get_layer_polygons().items():
+                    role_polygons.setdefault(l, []).extend(polygons)
+            elif isinstance(s, gdspy.PolygonSet):
+                role_polygons.setdefault(layer, []).extend(s.polygons)
+            elif isinstance(s, gdspy.FlexPath):
+                role_polygons.setdefault(layer, []).extend(s.get_polygons())
+            else:
+                raise Exception(
+                    f"Element to add needs to be either a `Shape` or `gdspy.PolygonSet`. This is a {s}"
+                )
+        return role_polygons
+
     def combine(
         self, shape, position=[0, 0], connect_point=[0, 0], add_refs=False, counter=None
     ):
-        shape = deepcopy(shape)
-        shape.translate(position[0] - connect_point[0], position[1] - connect_point[1])
-        self._center += shape._center
-        self._outer += shape._outer
-        self._ground += shape._ground
-        self._holes += shape._holes
+        # polygon sets are copied into the buffer with one translation, their
+        # copies keep views of the buffer as polygons; `Shape` and
+        # `gdspy.FlexPath` elements are copied and translated one by one
+        dx, dy = position[0] - connect_point[0], position[1] - connect_point[1]
+        matrix = transform.translation(dx, dy)
+        packed, polygons, tags = [], [], []
+        for i, name in enumerate(ROLES):
+            elements = getattr(self, f"_{name}")
+            for s in list(getattr(shape, f"_{name}")):
+                if not isinstance(s, gdspy.PolygonSet):
+                    elements.append(_translated_copy(s, dx, dy))
+                    continue
+                element = transform.copy_polygonset(s)
+                if isinstance(element, gdspy.Path):
+                    _move_path(element, "translate", dx, dy)
+                elements.append(element)
+                packed.append((element, len(polygons), len(s.polygons)))
+                polygons += s.polygons
+                tags += [i] * len(s.polygons)
+        if packed:
+            first, views = self._polygon_buffer.append(polygons, tags, matrix)
+            for element, start, count in packed:
+                element.polygons = views[start : start + count]
+                self._packed_elements.append([element, element.polygons, first + start])
 
         if add_refs:
-            self._merge_references(shape, counter)
+            self._merge_references(shape, counter, transform.translation(dx, dy))
 
     def translate(self, dx, dy):
-        for lst in [self._center, self._outer, self._ground]:
-            for s in lst:
-                s.translate(dx, dy)
-        self._reference.translate(dx, dy)
-        return self
+        matrix = transform.translation(dx, dy)
+        return self._transform(matrix, "translate", dx, dy)
 
     def rotate(self, radians, center=(0, 0)):
-        for lst in [self._center, self._outer, self._ground]:
-            for s in lst:
-                s.rotate(radians, center)
-        self._reference.rotate(radians, center)
-        return self
+        matrix = transform.rotation(radians, center)
+        return self._transform(matrix, "rotate", radians, center)
 
     def scale(self, scalex, scaley=None, center=(0, 0)):
-        for lst in [self._center, self._outer, self._ground]:
-            for s in lst:
-                s.scale(scalex, scaley, center)
-        self._reference.scale(scalex, scaley, center)
-        return self
+        matrix = transform.scaling(scalex, scaley, center)
+        return self._transform(matrix, "scale", scalex, scaley, center)
 
     def mirror(self, p1, p2=(0, 0)):
-        for lst in [self._center, self._outer, self._ground]:
-            for s in lst:
-                s.mirror(p1, p2)
-        self._reference.mirror(p1, p2)
+        return self._transform(transform.reflection(p1, p2), "mirror", p1, p2)
+
+    def _transform(self, matrix, method, *args):
+        # elements still holding their views of the buffer are transformed
+        # together, all others one by one
+        elements = self._packed_elements
+        self._packed_elements = [p for p in elements if p[0].polygons is p[1]]
+        if self._packed_elements:
+            views = self._polygon_buffer.transform(matrix)
+            for p in self._packed_elements:
+                element, first = p[0], p[2]
+                count = len(element.polygons)
+                if isinstance(element, gdspy.Path):
+                    _move_path(element, method, *args)
+                p[1] = element.polygons = views[first : first + count]
+        packed = {id(p[0]) for p in self._packed_elements}
+        for name in ROLES:
+            for s in getattr(self, f"_{name}"):
+                if id(s) not in packed:
+                    getattr(s, method)(*args)
+        getattr(self._reference, method)(*args)
         return self
 
     def fillet(self, radius):
+        options = arcs.get_fillet_options(radius, self.tolerance)
         for lst in [self._center, self._outer, self._ground]:
             for s in lst:
-                s.fillet(radius)
+                if isinstance(s, Shape):
+                    s.fillet(radius)
+                else:
+                    # filleted in place, so detached from the buffer first
+                    s.polygons = list(s.polygons)
+                    s.fillet(radius, **options)
         return self
 
+    def vertex_report(self):
+        # polygons and vertices per role and layer, before the booleans
+        report = {}
+        for name in ROLES:
+            elements = getattr(self, f"_{name}")
+            layer = self._layer if name in ["center", "outer"] else 0
+            if elements:
+                report[name] = arcs.get_counts(self._get_role_polygons(elements, layer))
+        return report
+
     # offset does not work for coplanar shapes yet - issue with 'Path' object
     # def offset(self, distance):
     #     for lst in [self._center, self._outer, self._ground]:
@@ -156,22 +250,176 @@ class CoplanarShape:
         else:
             raise Error("Layer must be an integer number.")
 
-    def _merge_references(self, element, counter):
-        for name, point in element.points.items():
-            if name == "ORIGIN":
-                continue
-            new_name = type(element).__name__.upper()
-            if counter is not None:
-                new_name += f" #{counter}"
-            new_name += f" {name}"
-            self.add_reference(new_name, point)
+    def _merge_references(self, element, counter, matrix=None):
+        new_name = type(element).__name__.upper()
+        if counter is not None:
+            new_name += f" #{counter}"
+        self._reference.merge(element._reference, new_name, matrix)
+
+    def find_points(self, prefix=""):
+        return self._reference.find(prefix)
 
     def add_reference(self, name, point):
         self._reference.add(name, point)
 
+    def _get_state(self, children=False):
+        # role elements are stored as flat polygons, `gdspy` elements keep
+        # their layer and `Shape` elements are restored as plain shapes; with
+        # `children` the `Shape` elements are stored as they are
+        roles, kinds, elements, layers, polygons, shapes = [], [], [], [], [], []
+        for i, name in enumerate(ROLES):
+            for s in getattr(self, f"_{name}"):
+                if isinstance(s, Shape) and children:
+                    layer_polygons = {}
+                    shapes.append(s)
+                elif isinstance(s, Shape):
+                    layer_polygons = s._get_layer_polygons()
+                elif isinstance(s, gdspy.PolygonSet):
+                    layer_polygons = {s.layers[0] if s.layers else 0: s.polygons}
+                elif isinstance(s, gdspy.FlexPath):
+                    layer_polygons = {s.layers[0]: s.get_polygons()}
+                else:
+                    raise TypeError(f"Cannot store this object: {s}")
+                for l, element_polygons in layer_polygons.items():
+                    elements += [len(roles)] * len(element_polygons)
+                    layers += [l] * len(element_polygons)
+                    polygons += element_polygons
+                roles.append(i)
+                kinds.append(isinstance(s, Shape))
+        vertices, offsets = packing.pack(polygons)
+        names, points = self._reference.find()
+        attributes = {k: v for k, v in vars(self).items() if k not in _INTERNAL}
+        state = {
+            "attributes": packing.pack_object(attributes),
+            "roles": np.array(roles, dtype=int),
+            "kinds": np.array(kinds, dtype=bool),
+            "elements": np.array(elements, dtype=int),
+            "layers": np.array(layers, dtype=int),
+            "vertices": vertices,
+            "offsets": offsets,
+            "reference_names": np.array(names, dtype=str),
+            "reference_points": points,
+        }
+        if children:
+            state["shapes"] = packing.pack_object(shapes)
+            state["key"] = packing.pack_object(self._key)
+        return state
+
+    def _set_state(self, state):
+        # the polygons of `gdspy` elements are copied into the buffer once, so
+        # that they can be changed like those of newly built shapes
+        self._reference = Reference()
+        self._reference.extend(
+            state["reference_names"].tolist(), state["reference_points"]
+        )
+        for name in ROLES:
+            setattr(self, f"_{name}", [])
+        self._polygon_buffer, self._packed_elements = PolygonBuffer(), []
+        polygons = packing.unpack(state["vertices"], state["offsets"])
+        shapes = None
+        if "shapes" in state:
+            shapes = iter(packing.unpack_object(state["shapes"]))
+        packed, packed_polygons, tags = [], [], []
+        for i, (role, kind) in enumerate(zip(state["roles"], state["kinds"])):
+            indices = np.flatnonzero(state["elements"] == i)
+            if kind and shapes is not None:
+                element = next(shapes)
+            elif kind:
+                element = Shape()
+                for l in np.unique(state["layers"][indices]):
+                    element._add_polygonset(
+                        [polygons[j] for j in indices if state["layers"][j] == l],
+                        layer=int(l),
+                    )
+            else:
+                layer = int(state["layers"][indices[0]]) if len(indices) else 0
+                element = gdspy.PolygonSet([], layer=layer)
+                element.layers = [layer] * len(indices)
+                element.datatypes = [0] * len(indices)
+                packed.append((element, len(packed_polygons), len(indices)))
+                packed_polygons += [polygons[j] for j in indices]
+                tags += [role] * len(indices)
+            getattr(self, f"_{ROLES[role]}").append(element)
+        first, views = self._polygon_buffer.append(packed_polygons, tags)
+        for element, start, count in packed:
+            element.polygons = views[start : start + count]
+            self._packed_elements.append([element, element.polygons, first + start])
+        self._key = None
+        if "key" in state:
+            self._key = packing.unpack_object(state["key"])
+        vars(self).update(packing.unpack_object(state["attributes"]))
+
+    def to_bytes(self):
+        return packing.pack_arrays(self._get_state(children=True))
+
+    @classmethod
+    def from_bytes(cls, data):
+        shape = cls.__new__(cls)
+        shape._set_state(packing.unpack_arrays(data))
+        return shape
+
+    def __reduce__(self):
+        if not self.cacheable:
+            # e.g. `CoplanarPath` has to keep its `gdspy.Path` elements
+            return copyreg.__newobj__, (type(self),), vars(self)
+        return _from_bytes, (type(self), self.to_bytes())
+
+    def __copy__(self):
+        result = type(self).__new__(type(self))
+        vars(result).update(vars(self))
+        return result
+
+    def __deepcopy__(self, memo):
+        result = type(self).__new__(type(self))
+        memo[id(self)] = result
+        vars(result).update(deepcopy(vars(self), memo))
+        return result
+
     def _draw(self):
         pass
 
     @property
     def points(self):
         return self._reference.points
+
+
+def _translated_copy(element, dx, dy):
+    if isinstance(element, Shape):
+        return element._copy().translate(dx, dy)
+    if isinstance(element, gdspy.FlexPath):
+        return transform.copy_element(element).translate(dx, dy)
+    raise Exception(f"Cannot combine this object: {element}")
+
+
+def _cut_holes(shape, polygons, layer):
+    # Holes on the ground layer are cut out of it tile by tile, with about
+    # `HOLES_PER_TILE` holes per tile, since a single boolean with all of them
+    # grows much faster than the number of holes. Holes on other layers are
+    # drawn there.
+    if layer != 0:
+        shape._add_polygonset(polygons, layer=layer)
+        return
+    tiles, min_size = shape.tiles, shape.min_tile_size
+    if tiles is None and len(polygons) > HOLES_PER_TILE:
+        boxes = spatial.get_boxes(polygons)
+        width, height = boxes[:, 2:].max(axis=0) - boxes[:, :2].min(axis=0)
+        side = np.sqrt(HOLES_PER_TILE * width * height / len(polygons))
+        shape._evaluate()  # the other roles are merged without tiles
+        shape.tiles = (int(np.ceil(width / side)), int(np.ceil(height / side)))
+        shape.min_tile_size = 0
+    shape._add_polygonset(polygons, layer=layer, operation="not")
+    shape._evaluate()
+    shape.tiles, shape.min_tile_size = tiles, min_size
+
+
+def _move_path(path, method, *args):
+    # updates the position, direction and width of a `gdspy.Path` whose
+    # polygons are transformed in the buffer
+    polygons, path.polygons = path.polygons, []
+    getattr(path, method)(*args)
+    path.polygons = polygons
+
+
+_INTERNAL = ["_reference", "_key", "_polygon_buffer", "_packed_elements"] + [
+    f"_{name}" for name in ROLES
+]
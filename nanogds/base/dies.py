@@ -0,0 +1,95 @@
+import numpy as np
+import re
+import string
+from collections import namedtuple
+
+# dies are named by column letter and row number, e.g. "B3"
+DIE_NAME = re.compile(r"([A-Z]+)(\d+)")
+
+Die = namedtuple("Die", ["name", "column", "row", "index"])
+
+
+class DieIndex:
+    # Cells placed in a mask template, indexed by name, column and row. The
+    # origin of the first placement of every cell is in `coordinates`.
+    def __init__(self, placements):
+        self._dies = {}  # name: Die
+        self._columns = {}  # column: [Die]
+        self._rows = {}  # row: [Die]
+        origins = []
+        for name, origin in placements:
+            if name in self._dies:
+                continue
+            match = DIE_NAME.fullmatch(name)
+            column, row = (match[1], int(match[2])) if match else (None, None)
+            die = Die(name, column, row, len(origins))
+            self._dies[name] = die
+            if match:
+                self._columns.setdefault(column, []).append(die)
+                self._rows.setdefault(row, []).append(die)
+            origins.append(origin)
+        self.coordinates = np.array(origins, dtype=float).reshape(-1, 2)
+
+    def __contains__(self, name):
+        return name in self._dies
+
+    def __getitem__(self, name):
+        return self._dies[name]
+
+    def __len__(self):
+        return len(self._dies)
+
+    def find(self, key=None, columns=None, rows=None, pattern=None, ring=False):
+        # `key` is a die name or a range like "B3:E6", `columns` letters (one
+        # column if a string) and `rows` numbers; the wafer ring is only
+        # included if `ring` is set
+        if key is not None:
+            dies = self._get_range(key)
+        elif columns is not None:
+            if isinstance(columns, str):
+                columns = [columns]
+            dies = [d for c in columns for d in self._columns.get(c, [])]
+            if rows is not None:
+                rows = set(rows)
+                dies = [d for d in dies if d.row in rows]
+        elif rows is not None:
+            dies = [d for r in rows for d in self._rows.get(r, [])]
+        else:
+            dies = list(self._dies.values())
+        if pattern is not None:
+            pattern = re.compile(pattern)
+            dies = [d for d in dies if pattern.fullmatch(d.name)]
+        if not ring:
+            dies = [d for d in dies if not d.name.startswith("WAFER_RING")]
+        return sorted(dies, key=lambda d: d.index)
+
+    def _get_range(self, key):
+        if ":" not in key:
+            return [self._dies[key]] if key in self._dies else []
+        first, last = (DIE_NAME.fullmatch(k.strip()) for k in key.split(":"))
+        if first is None or last is None:
+            raise Exception(f"Invalid die range '{key}'.")
+        columns = _column_range(first[1], last[1])
+        rows = range(min(int(first[2]), int(last[2])), max(int(first[2]), int(last[2])) + 1)
+        names = (f"{c}{r}" for c in columns for r in rows)
+        return [self._dies[n] for n in names if n in self._dies]
+
+
+def _column_range(first, last):
+    numbers = sorted([_column_number(first), _column_number(last)])
+    return [_column_letters(n) for n in range(numbers[0], numbers[1] + 1)]
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = 26 * number + string.ascii_uppercase.index(letter) + 1
+    return number
+
+
+def _column_letters(number):
+    letters = ""
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = string.ascii_uppercase[remainder] + letters
+    return letters
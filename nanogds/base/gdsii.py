@@ -0,0 +1,305 @@
+import gdspy
+import io
+import mmap
+import numpy as np
+import os
+import struct
+
+# GDSII record types
+UNITS = 0x03
+ENDLIB = 0x04
+BGNSTR = 0x05
+STRNAME = 0x06
+ENDSTR = 0x07
+BOUNDARY = 0x08
+PATH = 0x09
+SREF = 0x0A
+AREF = 0x0B
+TEXT = 0x0C
+LAYER = 0x0D
+DATATYPE = 0x0E
+XY = 0x10
+ENDEL = 0x11
+SNAME = 0x12
+COLROW = 0x13
+TEXTTYPE = 0x16
+PRESENTATION = 0x17
+STRING = 0x19
+STRANS = 0x1A
+MAG = 0x1B
+ANGLE = 0x1C
+PROPATTR = 0x2B
+BOX = 0x2D
+BOXTYPE = 0x2E
+
+# larger files are memory-mapped instead of read, smaller ones are not kept
+# open so that they can be overwritten while the index is cached
+MMAP_SIZE = 2 ** 24
+
+ANCHORS = ["nw", "n", "ne", "o", "w", "o", "e", "o", "sw", "s", "se"] + ["o"] * 5
+
+
+class GdsIndex:
+    # Structure of a GDSII file: the byte range of every cell and the cells it
+    # references with their origins. Geometry is only parsed for the cells
+    # that are loaded, the others can be copied to new files as they are.
+    def __init__(self, data):
+        self._data = data
+        self.unit, self.precision = 1e-6, 1e-9
+        self.cells = {}  # name: (start, end)
+        self.references = {}  # name: [(referenced name, origin)]
+        self._cells = {}  # cells parsed by `get_cells`, shared by all users
+        self._scan()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < MMAP_SIZE:
+                return cls(f.read())
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        # releases a memory-mapped file, cells parsed before stay valid
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def _get_data(self):
+        if self._data is None:
+            raise Exception("The GDSII file of this index has been closed.")
+        return self._data
+
+    def _scan(self):
+        data, position = self._data, 0
+        self._header_end = None
+        name = start = sname = None
+        while position < len(data):
+            length, record = struct.unpack_from(">HB", data, position)
+            if length < 4:
+                break
+            body = position + 4
+            if record == UNITS:
+                user, meters = _read_real8(data, body), _read_real8(data, body + 8)
+                self.unit, self.precision = meters / user, meters
+            elif record == BGNSTR:
+                if self._header_end is None:
+                    self._header_end = position
+                start = position
+            elif record == STRNAME:
+                name = _read_string(data, body, length - 4)
+                self.references[name] = []
+            elif record == ENDSTR:
+                self.cells[name] = (start, position + length)
+            elif record in (SREF, AREF):
+                sname = None
+            elif record == SNAME:
+                sname = _read_string(data, body, length - 4)
+            elif record == XY and sname is not None:
+                x, y = struct.unpack_from(">2i", data, body)
+                factor = self.precision / self.unit
+                self.references[name].append((sname, (x * factor, y * factor)))
+                sname = None
+            elif record == ENDLIB:
+                break
+            position += length
+        if self._header_end is None:
+            self._header_end = position
+
+    def get_bytes(self, name):
+        start, end = self.cells[name]
+        return self._get_data()[start:end]
+
+    def load(self, names):
+        # parses the given cells, references to other cells keep their names
+        cells = {name: self._read_cell(name) for name in names}
+        unsupported = [name for name, cell in cells.items() if cell is None]
+        if unsupported:
+            stream = io.BytesIO(
+                self._get_data()[: self._header_end]
+                + b"".join(self.get_bytes(name) for name in unsupported)
+                + struct.pack(">2H", 4, ENDLIB << 8)
+            )
+            cells.update(gdspy.GdsLibrary(infile=stream).cells)
+        for cell in cells.values():
+            for reference in cell.references:
+                if isinstance(reference.ref_cell, str):
+                    reference.ref_cell = cells.get(
+                        reference.ref_cell, reference.ref_cell
+                    )
+        return cells
+
+    def _read_cell(self, name):
+        # decodes the XY records of the cell directly into arrays, polygons
+        # are grouped into one `PolygonSet` per layer and datatype; returns
+        # None for cells with elements that are left to `gdspy` (paths and
+        # properties)
+        data = self._get_data()
+        factor = self.precision / self.unit
+        position, end = self.cells[name]
+        cell = gdspy.Cell(name, exclude_from_current=True)
+        polygons = {}  # (layer, datatype): [vertices]
+        element, kwargs = None, {}
+        while position < end:
+            length, record = struct.unpack_from(">HB", data, position)
+            body, size = position + 4, length - 4
+            if record in (BOUNDARY, BOX, TEXT, SREF, AREF):
+                element, kwargs = record, {}
+            elif record in (PATH, PROPATTR):
+                return None
+            elif record == LAYER:
+                kwargs["layer"] = struct.unpack_from(">h", data, body)[0]
+            elif record in (DATATYPE, BOXTYPE, TEXTTYPE):
+                kwargs["datatype"] = struct.unpack_from(">h", data, body)[0]
+            elif record == XY:
+                xy = np.frombuffer(data, ">i4", size // 4, body).reshape(-1, 2)
+                xy = factor * xy
+                if "xy" in kwargs:
+                    xy = np.concatenate((kwargs["xy"], xy))
+                kwargs["xy"] = xy
+            elif record == SNAME:
+                kwargs["ref_cell"] = _read_string(data, body, size)
+            elif record == STRING:
+                kwargs["text"] = _read_string(data, body, size)
+            elif record == COLROW:
+                columns, rows = struct.unpack_from(">2h", data, body)
+                kwargs["columns"], kwargs["rows"] = columns, rows
+            elif record == STRANS:
+                flags = struct.unpack_from(">H", data, body)[0]
+                kwargs["x_reflection"] = bool(flags & 0x8000)
+            elif record == MAG:
+                kwargs["magnification"] = _read_real8(data, body)
+            elif record == ANGLE:
+                kwargs["rotation"] = _read_real8(data, body)
+            elif record == PRESENTATION:
+                flags = struct.unpack_from(">H", data, body)[0]
+                kwargs["anchor"] = ANCHORS[flags & 0x000F]
+            elif record == ENDEL:
+                if element in (BOUNDARY, BOX):
+                    key = (kwargs.get("layer", 0), kwargs.get("datatype", 0))
+                    polygons.setdefault(key, []).append(kwargs["xy"][:-1])
+                elif element == TEXT:
+                    cell.add(_create_label(kwargs))
+                elif element == SREF:
+                    cell.add(_create_reference(kwargs))
+                elif element == AREF:
+                    cell.add(_create_array(kwargs))
+                element, kwargs = None, {}
+            position += length
+        for (layer, datatype), vertices in polygons.items():
+            cell.add(gdspy.PolygonSet(vertices, layer=layer, datatype=datatype))
+        return cell
+
+    def get_dependencies(self, name):
+        # `name` and all cells it references, directly or indirectly
+        names, pending = [], [name]
+        while pending:
+            n = pending.pop()
+            if n not in names and n in self.cells:
+                names.append(n)
+                pending += [r for r, _ in self.references[n]]
+        return names
+
+    def get_cells(self, name):
+        # the cell and its dependencies, parsed once and shared; copy them
+        # before making changes
+        names = self.get_dependencies(name)
+        missing = [n for n in names if n not in self._cells]
+        loaded = self.load(missing) if missing else {}
+        self._cells.update(loaded)
+        for cell in loaded.values():
+            for reference in cell.references:
+                if isinstance(reference.ref_cell, str):
+                    reference.ref_cell = self._cells.get(
+                        reference.ref_cell, reference.ref_cell
+                    )
+        return {n: self._cells[n] for n in names}
+
+
+_indices = {}  # (path, modification time, size): `GdsIndex`
+
+
+def get_index(path):
+    # process-wide cache, files are read again when they change and the index
+    # of the previous version is closed
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _indices:
+        clear_cache(path)
+        _indices[key] = GdsIndex.from_file(path)
+    return _indices[key]
+
+
+def clear_cache(path=None):
+    # closes the indices of `path` (of all files if None), e.g. to overwrite
+    # or delete a memory-mapped file on Windows
+    path = None if path is None else os.path.abspath(path)
+    for key in [k for k in _indices if path is None or k[0] == path]:
+        _indices.pop(key).close()
+
+
+def _create_label(kwargs):
+    return gdspy.Label(
+        kwargs["text"],
+        kwargs["xy"][0],
+        anchor=kwargs.get("anchor", "o"),
+        rotation=kwargs.get("rotation"),
+        magnification=kwargs.get("magnification"),
+        x_reflection=kwargs.get("x_reflection", False),
+        layer=kwargs.get("layer", 0),
+        texttype=kwargs.get("datatype", 0),
+    )
+
+
+def _create_reference(kwargs):
+    reference = gdspy.CellReference(
+        kwargs["ref_cell"],
+        origin=kwargs["xy"][0],
+        rotation=kwargs.get("rotation"),
+        magnification=kwargs.get("magnification"),
+        x_reflection=kwargs.get("x_reflection", False),
+        ignore_missing=True,
+    )
+    reference.ref_cell = kwargs["ref_cell"]  # not a cell of `current_library`
+    return reference
+
+
+def _create_array(kwargs):
+    # the spacing is recovered from the array's corner points as in `gdspy`
+    xy = kwargs["xy"].ravel()
+    columns, rows = kwargs["columns"], kwargs["rows"]
+    x2, y3 = xy[2], xy[5]
+    if "x_reflection" in kwargs:
+        if "rotation" in kwargs:
+            sa = -np.sin(np.radians(kwargs["rotation"]))
+            ca = np.cos(np.radians(kwargs["rotation"]))
+            x2 = (xy[2] - xy[0]) * ca - (xy[3] - xy[1]) * sa + xy[0]
+            y3 = (xy[4] - xy[0]) * sa + (xy[5] - xy[1]) * ca + xy[1]
+        if kwargs["x_reflection"]:
+            y3 = 2 * xy[1] - y3
+    reference = gdspy.CellArray(
+        kwargs["ref_cell"],
+        columns,
+        rows,
+        ((x2 - xy[0]) / columns, (y3 - xy[1]) / rows),
+        origin=xy[0:2],
+        rotation=kwargs.get("rotation"),
+        magnification=kwargs.get("magnification"),
+        x_reflection=kwargs.get("x_reflection", False),
+        ignore_missing=True,
+    )
+    reference.ref_cell = kwargs["ref_cell"]
+    return reference
+
+
+def _read_real8(data, position):
+    # GDSII 8-byte real: sign bit, 7-bit base-16 exponent, 56-bit mantissa
+    first = data[position]
+    exponent = (first & 0x7F) - 64
+    mantissa = int.from_bytes(data[position + 1 : position + 8], "big") / 2 ** 56
+    value = mantissa * 16.0 ** exponent
+    return -value if first & 0x80 else value
+
+
+def _read_string(data, position, length):
+    return data[position : position + length].rstrip(b"\0").decode("ascii")
@@ -1,6 +1,8 @@
 import gdspy
 import numpy as np
-from copy import Error, deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy, Error
+import hashlib
 import os
 
 try:
@@ -10,7 +12,13 @@ except ImportError:
     import importlib_resources as pkg_resources
 
 from .. import resources
-from .shape import Shape
+from . import packing, profiling, raster, transform
+from .shape import Shape, ShapeArray
+from .coplanar_shape import CoplanarShape
+from .dies import DieIndex
+from . import gdsii
+from .gdsii import GdsIndex
+from .writer import StreamWriter
 
 
 class GDS:
@@ -18,8 +26,14 @@ class GDS:
         self._lib = gdspy.GdsLibrary()
         gdspy.current_library = self._lib
         self._top_cell = self._lib.new_cell("TOP", overwrite_duplicate=True)
+        self._prototypes = {}
+        self._stream = None  # `StreamWriter` if cells are written when added
+        self._stream_name = None
+        self._shared = set()  # names of cells shared with the parse cache
 
     def add(self, name, shapes, origin=(0, 0)):
+        if self._stream is not None and self._stream.is_written(name):
+            raise Exception(f"Cell '{name}' has already been written.")
         if name not in self._lib.cells.keys():
             cell = self._lib.new_cell(name)
         else:
@@ -31,43 +45,194 @@ class GDS:
             self._add_to_cell(cell, shapes, origin)
         cell_ref = gdspy.CellReference(cell)
         self._top_cell.add(cell_ref)
+        if self._stream is not None:
+            self._stream.write(cell)
 
     def _add_to_cell(self, cell, element, origin):
-        element = deepcopy(element)
         if isinstance(element, Shape):
-            cell.add(element.shapes)
+            element._evaluate()
+            cell.add(
+                [
+                    transform.copy_polygonset(s)
+                    for s in element._shapes.values()
+                    if s is not None
+                ]
+            )
+            self._add_children(cell, element._children)
         else:
-            cell.add(element)
+            cell.add(transform.copy_element(element))
         return cell
 
+    def _add_children(self, cell, children):
+        # translated copies of the same shape on a regular grid are written
+        # as arrays, split into rectangular blocks where sites are empty
+        groups = {}
+        for child, matrix in children:
+            linear = (matrix @ child._matrix)[:2, :2]
+            if (
+                isinstance(child, Shape)
+                and child._key is not None
+                and np.allclose(linear, np.identity(2))
+            ):
+                groups.setdefault(child._key, []).append((child, matrix))
+            else:
+                self._add_child(cell, child, matrix)
+        for group in groups.values():
+            points = [(matrix @ child._matrix)[:2, 2] for child, matrix in group]
+            lattice = raster.get_lattice(points) if len(group) > 1 else None
+            if lattice is None:
+                for child, matrix in group:
+                    self._add_child(cell, child, matrix)
+                continue
+            origin, spacing, indices = lattice
+            occupied = np.zeros(indices.max(axis=0)[::-1] + 1, dtype=bool)
+            occupied[indices[:, 1], indices[:, 0]] = True
+            prototype = self._get_prototype_cell(group[0][0])
+            for row, column, rows, columns in raster.get_blocks(occupied).T:
+                position = origin + (column, row) * spacing
+                if rows == columns == 1:
+                    cell.add(gdspy.CellReference(prototype, origin=position))
+                else:
+                    cell.add(
+                        gdspy.CellArray(
+                            prototype, int(columns), int(rows), spacing, origin=position
+                        )
+                    )
+
+    def _add_child(self, cell, child, matrix):
+        placement = transform.decompose(matrix @ child._matrix)
+        if isinstance(child, ShapeArray):
+            # the array lattice is only transformed like the copies if the
+            # shape was not rotated or scaled after construction
+            if not np.allclose(child._matrix[:2, :2], np.identity(2)):
+                placement = None
+        if placement is None:
+            for l, polygons in child._get_layer_polygons(matrix).items():
+                cell.add(gdspy.PolygonSet(polygons, layer=l))
+            return
+        origin, rotation, magnification, x_reflection = placement
+        if isinstance(child, ShapeArray):
+            # GDSII arrays do not magnify the lattice
+            factor = 1 if magnification is None else magnification
+            cell_ref = gdspy.CellArray(
+                self._get_prototype_cell(child._shape),
+                child._columns,
+                child._rows,
+                (child._spacing[0] * factor, child._spacing[1] * factor),
+                origin=origin,
+                rotation=rotation,
+                magnification=magnification,
+                x_reflection=x_reflection,
+            )
+        else:
+            cell_ref = gdspy.CellReference(
+                self._get_prototype_cell(child),
+                origin=origin,
+                rotation=rotation,
+                magnification=magnification,
+                x_reflection=x_reflection,
+            )
+        cell.add(cell_ref)
+
+    def _get_prototype_cell(self, shape):
+        # one cell per class and construction parameters, holding the shape
+        # as it was constructed
+        if shape._key not in self._prototypes.keys():
+            digest = hashlib.sha1(repr(shape._key).encode()).hexdigest()[:8]
+            cell = self._lib.new_cell(f"{type(shape).__name__.upper()}_{digest}")
+            inverse = np.linalg.inv(shape._matrix)
+            shape._evaluate()
+            cell.add(
+                [
+                    transform.copy_polygonset(s, inverse)
+                    for s in shape._shapes.values()
+                    if s is not None
+                ]
+            )
+            self._add_children(
+                cell, [(child, inverse @ matrix) for child, matrix in shape._children]
+            )
+            self._prototypes[shape._key] = cell
+        return self._prototypes[shape._key]
+
     def load_gds(self, cell_name, path="eth.gds", origin=(0, 0), rotation=0):
-        self._lib.read_gds(path)
-        cell_ref = gdspy.CellReference(
-            self._lib.cells[cell_name], origin=origin, rotation=rotation
-        )
+        cell = self._import_cell(path, cell_name)
+        cell_ref = gdspy.CellReference(cell, origin=origin, rotation=rotation)
         self._top_cell.add(cell_ref)
 
     def get_cell_from_gds(self, filename, cellname, origin=(0, 0), rotation=0):
-        temp_lib = gdspy.GdsLibrary(infile=filename)
-        if cellname in temp_lib.cells.keys():
-            cell = temp_lib.cells[cellname]
-        else:
-            raise Error(f"File {filename} contains no cell with name {cellname}.")
+        cell = self._import_cell(filename, cellname)
         cell_ref = gdspy.CellReference(cell, origin=origin, rotation=rotation)
-        self._lib.add(cell)
         self._top_cell.add(cell_ref)
 
+    def _import_cell(self, path, name):
+        # files are parsed once per process, only the cell and its
+        # dependencies are added to the library
+        index = gdsii.get_index(path)
+        if name not in index.cells.keys():
+            raise Error(f"File {path} contains no cell with name {name}.")
+        cells = index.get_cells(name)
+        self._lib.add(list(cells.values()), include_dependencies=False)
+        self._shared.update(cells.keys())
+        return cells[name]
+
+    def _unshare(self, name):
+        # copies a shared cell and the shared cells referencing it before it
+        # is modified
+        originals = {}
+        pending = [name]
+        while pending:
+            n = pending.pop()
+            if n in originals or n not in self._shared:
+                continue
+            originals[n] = self._lib.cells[n]
+            pending += [
+                c.name
+                for c in self._lib.cells.values()
+                if any(r.ref_cell is originals[n] for r in c.references)
+            ]
+        copies = {n: _copy_cell(c) for n, c in originals.items()}
+        replaced = {id(c): copies[n] for n, c in originals.items()}
+        self._lib.cells.update(copies)
+        self._shared -= set(copies.keys())
+        for cell in self._lib.cells.values():
+            if cell.name not in self._shared:
+                for reference in cell.references:
+                    reference.ref_cell = replaced.get(
+                        id(reference.ref_cell), reference.ref_cell
+                    )
+
     def change_cell_layer(self, cell, layer):
+        self._unshare(cell)
         cell = self._lib.cells[cell]
         for p in cell.polygons:
             p.layers = [layer] * len(p.layers)
 
     def translate_cell(self, name, dx, dy):
+        self._unshare(name)
         for p in self._lib.cells[name].polygons:
             p.translate(dx, dy)
 
-    def save(self, name):
-        self._lib.write_gds(f"{name}.gds")
+    def stream(self, name):
+        # cells added from now on are written right away and released, call
+        # `save` to write the remaining cells and close the file
+        self._stream = StreamWriter(f"{name}.gds", self._lib, keep=self._shared)
+        self._stream_name = name
+
+    def save(self, name=None, streaming=False):
+        if self._stream is None and not streaming:
+            start = profiling.start()
+            self._lib.write_gds(f"{name}.gds")
+            if start is not None:
+                polygonsets = _get_polygonsets(self._lib)
+                profiling.record("write", f"{name}.gds", None, start, polygonsets)
+            return
+        if self._stream is None:
+            self.stream(name)
+        elif name is not None and name != self._stream_name:
+            raise Exception(f"Cells are being written to '{self._stream_name}.gds'.")
+        self._stream.close(self._lib)
+        self._stream = None
 
 
 class MaskTemplate:
@@ -75,48 +240,144 @@ class MaskTemplate:
         self, template="wafer_template",
     ):
         path_to_template = os.path.join(resources.__path__[0], template + ".gds")
-        self._lib = gdspy.GdsLibrary(infile=path_to_template)
+        # only the structure of the template is read, the die cells are
+        # loaded when shapes are added to them
+        self._template = GdsIndex.from_file(path_to_template)
+        self._lib = gdspy.GdsLibrary()
+        self._placements = self._template.references.get("Template", [])
+        self._dies = DieIndex(self._placements)
+        self._stream = None  # `StreamWriter` if cells are written when added
+        self._stream_name = None
+
+    @property
+    def placements(self):
+        # (name, origin) of the cells placed in the template
+        return list(self._placements)
 
     def add_reference(self, name, shape, add_to):
-        newcell = self._lib.new_cell(name, overwrite_duplicate=True)
-        newcell.add(shape)
-        newcell_ref = gdspy.CellReference(newcell)
-        counter = 0
-        for ref in self._lib.cells["Template"].references:
-            if ref.ref_cell.name == add_to:
-                ref.ref_cell.add(newcell_ref)
-                counter += 1
-                print(
-                    f"{counter}: Added reference to cell '{name}' to '{ref.ref_cell.name}'"
-                )
+        newcell = self._new_cell(name, shape)
+        self._add_to_dies(newcell, [add_to] if add_to in self._dies else [])
 
     def add_reference_by_columns(self, name, shape, columns):
-        newcell = self._lib.new_cell(name, overwrite_duplicate=True)
-        newcell.add(shape)
-        newcell_ref = gdspy.CellReference(newcell)
-        counter = 0
-        for ref in self._lib.cells["Template"].references:
-            for column in columns:
-                if ref.ref_cell.name.startswith(column):
-                    ref.ref_cell.add(newcell_ref)
-                    counter += 1
-                    print(
-                        f"{counter}: Added reference to cell '{name}' to '{ref.ref_cell.name}'"
-                    )
+        newcell = self._new_cell(name, shape)
+        # die names starting with one of `columns`, as before the die index
+        prefixes = tuple(columns)
+        dies = [d for d in self._dies.find(ring=True) if d.name.startswith(prefixes)]
+        self._add_to_dies(newcell, [d.name for d in dies])
 
     def add_reference_to_all(self, name, shape):
+        newcell = self._new_cell(name, shape)
+        self._add_to_dies(newcell, [d.name for d in self._dies.find()])
+
+    def add_reference_to_dies(self, name, shape, dies):
+        # `dies` as returned by `find_dies` or die names
+        newcell = self._new_cell(name, shape)
+        names = [d if isinstance(d, str) else d.name for d in dies]
+        self._add_to_dies(newcell, [n for n in names if n in self._dies])
+
+    def find_dies(self, key=None, columns=None, rows=None, pattern=None, ring=False):
+        # e.g. find_dies("B3:E6"), find_dies(columns=["A", "B"], rows=range(1, 4)) or
+        # find_dies(pattern="[A-C]1[0-9]"); columns are letters, rows numbers
+        return self._dies.find(key, columns, rows, pattern, ring)
+
+    @property
+    def die_coordinates(self):
+        # origins of the dies, row `die.index` belongs to `die`
+        return self._dies.coordinates
+
+    def _add_to_dies(self, newcell, dies):
+        newcell_ref = gdspy.CellReference(newcell)
+        for counter, die in enumerate(dies, 1):
+            self._get_cell(die).add(newcell_ref)
+            print(f"{counter}: Added reference to cell '{newcell.name}' to '{die}'")
+
+    def _get_cell(self, name):
+        if name not in self._lib.cells.keys():
+            self._lib.add(self._template.load([name])[name])
+        return self._lib.cells[name]
+
+    def _get_binary_cells(self):
+        # template cells that were not loaded are copied as they are
+        return [
+            self._template.get_bytes(name)
+            for name in self._template.cells.keys()
+            if name not in self._lib.cells.keys()
+        ]
+
+    def _new_cell(self, name, shape):
+        if self._stream is not None and self._stream.is_written(name):
+            raise Exception(f"Cell '{name}' has already been written.")
         newcell = self._lib.new_cell(name, overwrite_duplicate=True)
         newcell.add(shape)
-        newcell_ref = gdspy.CellReference(newcell)
-        counter = 0
-        for ref in self._lib.cells["Template"].references:
-            if ref.ref_cell.name.startswith("WAFER_RING"):
-                continue
-            ref.ref_cell.add(newcell_ref)
-            counter += 1
-            print(
-                f"{counter}: Added reference to cell '{name}' to '{ref.ref_cell.name}'"
-            )
+        if self._stream is not None:
+            self._stream.write(newcell)
+        return newcell
+
+    def populate(self, mapping, builder, workers=None):
+        # `mapping` maps die names to the keyword arguments of `builder`, which
+        # returns the die's `Shape` and has to be importable by the workers
+        if workers == 1:
+            results = (_build_die(builder, kwargs) for kwargs in mapping.values())
+            for die, packed in zip(mapping.keys(), results):
+                self._add_packed_die(die, packed)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                die: executor.submit(_build_die, builder, kwargs)
+                for die, kwargs in mapping.items()
+            }
+            for die in mapping.keys():
+                # drop each result once added, the cell may already be written
+                self._add_packed_die(die, futures.pop(die).result())
+
+    def _add_packed_die(self, die, packed):
+        shapes = [
+            gdspy.PolygonSet(polygons, layer=layer)
+            for layer, polygons in packing.unpack_layers(packed).items()
+        ]
+        self.add_reference(f"{die}_SHAPE", shapes, die)
+
+    def stream(self, name):
+        # cells added from now on are written right away and released, call
+        # `write` to write the template cells and close the file
+        self._stream = StreamWriter(f"{name}.gds", self._lib)
+        self._stream_name = name
+
+    def write(self, name=None, streaming=False):
+        if not np.isclose(self._template.precision, self._lib.precision, rtol=1e-6):
+            # the raw template cells would be scaled, load them all
+            for cell_name in self._template.cells.keys():
+                self._get_cell(cell_name)
+        if self._stream is None and not streaming:
+            start = profiling.start()
+            self._lib.write_gds(f"{name}.gds", binary_cells=self._get_binary_cells())
+            if start is not None:
+                polygonsets = _get_polygonsets(self._lib)
+                profiling.record("write", f"{name}.gds", None, start, polygonsets)
+            return
+        if self._stream is None:
+            self.stream(name)
+        elif name is not None and name != self._stream_name:
+            raise Exception(f"Cells are being written to '{self._stream_name}.gds'.")
+        self._stream.close(self._lib, self._get_binary_cells())
+        self._stream = None
+
+
+def _get_polygonsets(library):
+    return [p for cell in library.cells.values() for p in cell.polygons]
+
+
+def _copy_cell(cell):
+    result = gdspy.Cell(cell.name, exclude_from_current=True)
+    result.polygons = [transform.copy_polygonset(p) for p in cell.polygons]
+    result.paths = [transform.copy_element(p) for p in cell.paths]
+    result.labels = [copy(l) for l in cell.labels]
+    result.references = [copy(r) for r in cell.references]
+    return result
+
 
-    def write(self, name):
-        self._lib.write_gds(f"{name}.gds")
+def _build_die(builder, kwargs):
+    shape = builder(**kwargs)
+    if isinstance(shape, CoplanarShape):
+        shape = shape.get_shape()
+    return packing.pack_layers(shape._get_layer_polygons())
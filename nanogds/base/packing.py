@@ -0,0 +1,76 @@
+import json
+import pickle
+import struct
+import numpy as np
+
+MAGIC = b"NANOGDS1"  # start of `pack_arrays` data
+
+
+# Polygons are packed into one (N, 2) vertex array plus the offsets of the
+# individual polygons, which is cheap to pickle, store and send to processes.
+
+
+def pack(polygons):
+    polygons = [np.asarray(p, dtype=float).reshape(-1, 2) for p in polygons]
+    offsets = np.cumsum([0] + [len(p) for p in polygons])
+    if not polygons:
+        return np.zeros((0, 2)), offsets
+    return np.concatenate(polygons), offsets
+
+
+def unpack(vertices, offsets):
+    return [vertices[i:j] for i, j in zip(offsets[:-1], offsets[1:])]
+
+
+def pack_layers(layer_polygons):
+    return {layer: pack(polygons) for layer, polygons in layer_polygons.items()}
+
+
+def unpack_layers(packed):
+    return {layer: unpack(*arrays) for layer, arrays in packed.items()}
+
+
+def pack_object(obj):
+    return np.frombuffer(pickle.dumps(obj), dtype=np.uint8)
+
+
+def unpack_object(array):
+    return pickle.loads(np.asarray(array, dtype=np.uint8).tobytes())
+
+
+def pack_arrays(arrays):
+    # named arrays as bytes: a JSON header with the name, dtype, shape and
+    # position of every array followed by the raw buffers, aligned to 8 bytes
+    # so that `unpack_arrays` can return views instead of copies
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    header, size = [], 0
+    for name, a in arrays.items():
+        header.append([name, a.dtype.str, list(a.shape), size])
+        size += _align(a.nbytes)
+    encoded = json.dumps(header).encode()
+    start = _align(16 + len(encoded))  # magic and header length first
+    data = bytearray(start + size)
+    struct.pack_into(f"<8sQ{len(encoded)}s", data, 0, MAGIC, len(encoded), encoded)
+    for (_, _, _, position), a in zip(header, arrays.values()):
+        data[start + position : start + position + a.nbytes] = a.tobytes()
+    return bytes(data)
+
+
+def unpack_arrays(data):
+    # read-only views of `data` (bytes, memory-mapped files, ...)
+    data = memoryview(data).cast("B")
+    magic, length = struct.unpack_from("<8sQ", data, 0)
+    if magic != MAGIC:
+        raise Exception("The data was not written by `pack_arrays`.")
+    header = json.loads(bytes(data[16 : 16 + length]))
+    start = _align(16 + length)
+    return {
+        name: np.frombuffer(
+            data, dtype, int(np.prod(shape)), start + position
+        ).reshape(shape)
+        for name, dtype, shape, position in header
+    }
+
+
+def _align(size):
+    return -(-size // 8) * 8
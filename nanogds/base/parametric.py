@@ -0,0 +1,110 @@
+import numpy as np
+from collections import OrderedDict
+
+from . import transform
+
+POLICIES = ["tolerance", "grid"]  # class attributes that affect the geometry
+
+
+class Parametric(type):
+    # Remembers the constructor arguments of every instance. Shapes built from
+    # the same class and arguments are identical up to the transformations
+    # applied after construction, which are tracked in `_matrix`.
+    #
+    # If a `ShapeCache` is set as `cache` on the class, built instances are
+    # stored on disk and loaded instead of being drawn again. If a `ShapeMemo`
+    # is set as `memo`, instances are copies of one prototype per arguments.
+    def __call__(cls, *args, **kwargs):
+        # shapes built without arguments are filled by the caller, so they
+        # have no key
+        key = construction_key(cls, args, kwargs) if args or kwargs else None
+        if key is None or not cls.cacheable:
+            return _initialize(super().__call__(*args, **kwargs), key)
+        memo = getattr(cls, "memo", None)
+        if memo is None:
+            return _construct(cls, key, args, kwargs)
+        prototype = memo.get(key)
+        if prototype is None:
+            prototype = _construct(cls, key, args, kwargs)
+            memo.put(key, prototype)
+        return prototype._copy()
+
+
+class ShapeMemo:
+    # least recently used prototypes, never handed out themselves
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._prototypes = OrderedDict()
+
+    def get(self, key):
+        prototype = self._prototypes.get(key)
+        if prototype is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._prototypes.move_to_end(key)
+        return prototype
+
+    def put(self, key, prototype):
+        self._prototypes[key] = prototype
+        while len(self._prototypes) > self.max_size:
+            self._prototypes.popitem(last=False)
+
+    def clear(self):
+        self._prototypes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._prototypes)
+
+    def __repr__(self):
+        return (
+            f"ShapeMemo(size={len(self)}/{self.max_size}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+
+def _construct(cls, key, args, kwargs):
+    cache = getattr(cls, "cache", None)
+    instance = None if cache is None else cache.load(key)
+    if instance is None:
+        instance = type.__call__(cls, *args, **kwargs)
+        if cache is not None:
+            cache.store(key, instance)
+    return _initialize(instance, key)
+
+
+def _initialize(instance, key):
+    instance._key = key
+    if hasattr(instance, "_matrix"):
+        instance._matrix = transform.identity()
+    return instance
+
+
+def construction_key(cls, args, kwargs):
+    # the arc tolerance and grid of the class change the drawn geometry too
+    try:
+        return (
+            cls.__module__,
+            cls.__qualname__,
+            _freeze(args),
+            _freeze(sorted(kwargs.items())),
+            _freeze([getattr(cls, name, None) for name in POLICIES]),
+        )
+    except TypeError:
+        return None
+
+
+def _freeze(value):
+    if value is None or isinstance(value, (bool, int, float, str, np.generic)):
+        return value
+    if isinstance(value, np.ndarray):
+        return ("ndarray", value.shape, _freeze(value.ravel().tolist()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return ("dict", _freeze(sorted(value.items())))
+    raise TypeError(f"Cannot use {value} as construction parameter.")
@@ -0,0 +1,128 @@
+import gdspy
+import json
+import os
+import time
+from collections import namedtuple
+
+# One timed operation. `phase` is "boolean", "transform", "copy", "get_shape"
+# or "write", `name` the shape class (or cell or file name for writes) and
+# `layer` the layer, None if the operation is not bound to one.
+Event = namedtuple(
+    "Event",
+    [
+        "phase",
+        "name",
+        "layer",
+        "start",
+        "duration",
+        "polygons_in",
+        "vertices_in",
+        "polygons_out",
+        "vertices_out",
+    ],
+)
+
+_callbacks = []  # called with every `Event`
+
+
+def add_callback(callback):
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
+
+
+def start():
+    # start time of an operation, or None if nobody records events
+    return time.perf_counter() if _callbacks else None
+
+
+def record(phase, name, layer, start, inputs=(), outputs=()):
+    # `inputs` and `outputs` are polygon sets or lists of polygons
+    duration = time.perf_counter() - start
+    event = Event(phase, name, layer, start, duration, *_count(inputs), *_count(outputs))
+    for callback in list(_callbacks):
+        callback(event)
+
+
+class Profile:
+    # Records the events while active:
+    #
+    #     with Profile() as profile:
+    #         lib.add("CHIP", chip.get_shape())
+    #     profile.to_chrome_trace("chip.json")
+    def __init__(self):
+        self.events = []
+        self._callback = self.events.append
+
+    def __enter__(self):
+        add_callback(self._callback)
+        return self
+
+    def __exit__(self, *args):
+        remove_callback(self._callback)
+
+    def summary(self):
+        # totals per phase, name and layer, slowest first
+        totals = {}
+        for event in self.events:
+            key = (event.phase, event.name, event.layer)
+            if key not in totals:
+                totals[key] = dict(
+                    phase=event.phase, name=event.name, layer=event.layer, count=0
+                )
+                totals[key].update(dict.fromkeys(Event._fields[4:], 0))
+            total = totals[key]
+            total["count"] += 1
+            for field in Event._fields[4:]:
+                total[field] += getattr(event, field)
+        return sorted(totals.values(), key=lambda t: -t["duration"])
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "summary": self.summary(),
+                    "events": [event._asdict() for event in self.events],
+                },
+                f,
+                indent=1,
+                default=_to_builtin,
+            )
+
+    def to_chrome_trace(self, path):
+        # for chrome://tracing or https://ui.perfetto.dev
+        origin = min((event.start for event in self.events), default=0)
+        trace = [
+            {
+                "name": f"{event.phase} {event.name}",
+                "cat": event.phase,
+                "ph": "X",
+                "ts": 1e6 * (event.start - origin),
+                "dur": 1e6 * event.duration,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": {f: getattr(event, f) for f in Event._fields[5:] + ("layer",)},
+            }
+            for event in self.events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace}, f, default=_to_builtin)
+
+
+def _count(elements):
+    polygons = vertices = 0
+    for element in elements:
+        if element is None:
+            continue
+        if isinstance(element, gdspy.PolygonSet):
+            element = element.polygons
+        polygons += len(element)
+        vertices += sum(len(p) for p in element)
+    return polygons, vertices
+
+
+def _to_builtin(value):
+    # NumPy scalars, e.g. layers
+    return value.item() if hasattr(value, "item") else str(value)
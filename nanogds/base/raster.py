@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def get_runs(polygons, pitch):
+    # Grid points (i * pitch, j * pitch) inside the polygons (even-odd rule) as
+    # runs along x: row j, first column i and number of points. Every edge is
+    # intersected with the grid rows it spans, so the cost grows with the
+    # number of rows and edges instead of the number of grid points.
+    polygons = [np.asarray(p, dtype=float) for p in polygons]
+    if not polygons:
+        return np.zeros((3, 0), dtype=int)
+    start = np.concatenate(polygons)
+    end = np.concatenate([np.roll(p, -1, axis=0) for p in polygons])
+    low = np.ceil(np.minimum(start[:, 1], end[:, 1]) / pitch).astype(int)
+    high = np.ceil(np.maximum(start[:, 1], end[:, 1]) / pitch).astype(int)
+    counts = high - low  # rows in [min y, max y), horizontal edges have none
+    edges = np.repeat(np.arange(len(start)), counts)
+    rows = np.repeat(low, counts) + np.arange(len(edges)) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    x0, y0 = start[edges, 0], start[edges, 1]
+    x1, y1 = end[edges, 0], end[edges, 1]
+    x = x0 + (rows * pitch - y0) * (x1 - x0) / (y1 - y0)
+    order = np.lexsort((x, rows))
+    rows, x = rows[order], x[order]
+    # crossings come in pairs per row: inside between the first and second
+    first = np.ceil(x[0::2] / pitch).astype(int)
+    last = np.floor(x[1::2] / pitch).astype(int)
+    runs = np.stack([rows[0::2], first, last - first + 1])
+    return runs[:, runs[2] > 0]
+
+
+def get_blocks(occupied):
+    # greedy decomposition of a boolean grid (rows, columns) into rectangular
+    # blocks: row, column, number of rows and number of columns
+    occupied = np.asarray(occupied, dtype=bool)
+    padded = np.pad(occupied, ((0, 0), (1, 1))).astype(np.int8)
+    rows, first = np.nonzero(np.diff(padded, axis=1) == 1)
+    _, last = np.nonzero(np.diff(padded, axis=1) == -1)
+    return merge_runs(np.stack([rows, first, last - first]))
+
+
+def merge_runs(runs):
+    # runs (row, first column, count) that cover the same columns in
+    # consecutive rows are merged into blocks (row, column, rows, columns)
+    row, column, count = np.asarray(runs, dtype=int).reshape(3, -1)
+    order = np.lexsort((row, count, column))
+    row, column, count = row[order], column[order], count[order]
+    new = np.ones(len(row), dtype=bool)
+    new[1:] = (column[1:] != column[:-1]) | (count[1:] != count[:-1])
+    new[1:] |= row[1:] != row[:-1] + 1
+    starts = np.flatnonzero(new)
+    heights = np.diff(np.append(starts, len(row)))
+    return np.stack([row[starts], column[starts], heights, count[starts]])
+
+
+def get_lattice(points, tolerance=1e-6):
+    # origin, spacing and integer indices (column, row) of points on a regular
+    # grid, or None if they are not on one or the grid would be mostly empty
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    origin = points.min(axis=0)
+    spacing = np.ones(2)
+    for k in range(2):
+        steps = np.diff(np.unique(np.round(points[:, k], 9)))
+        if len(steps):
+            spacing[k] = steps.min()
+    indices = np.round((points - origin) / spacing).astype(int)
+    if not np.allclose(origin + indices * spacing, points, atol=tolerance):
+        return None
+    if len(np.unique(indices, axis=0)) < len(points):
+        return None  # points at the same position
+    shape = indices.max(axis=0) + 1
+    if np.prod(shape) > 100 * len(points):
+        return None
+    return origin, spacing, indices
@@ -1,44 +1,77 @@
-import gdspy
 import numpy as np
-from copy import deepcopy
+from collections.abc import Mapping
+
+from . import transform
 
 
 class Reference:
+    # named points stored as rows of a single (N, 2) array
     def __init__(self):
-        self._points = {}
+        self._names = {}
+        self._array = np.zeros((0, 2))
 
     def add(self, name, point):
-        self._points[name] = np.array(point)
+        self.extend([name], [point])
+
+    def extend(self, names, points):
+        indices = [self._names.setdefault(name, len(self._names)) for name in names]
+        if len(self._names) > len(self._array):
+            array = np.zeros((max(len(self._names), 2 * len(self._array)), 2))
+            array[: len(self._array)] = self._array
+            self._array = array
+        if indices:
+            self._array[indices] = np.asarray(points, dtype=float).reshape(-1, 2)
+
+    def merge(self, other, prefix, matrix=None):
+        names, points = other.find()
+        keep = [i for i, name in enumerate(names) if name != "ORIGIN"]
+        points = transform.apply(matrix, [points[keep]])[0]
+        self.extend([f"{prefix} {names[i]}" for i in keep], points)
+
+    def find(self, prefix=""):
+        names = [name for name in self._names.keys() if name.startswith(prefix)]
+        return names, self._array[[self._names[name] for name in names]]
+
+    def transform(self, matrix):
+        n = len(self._names)
+        self._array[:n] = transform.apply(matrix, [self._array[:n]])[0]
 
     def translate(self, dx, dy):
-        shape = self._get_shape()
-        shape.translate(dx, dy)
-        self._get_points_from_shape(shape)
+        self.transform(transform.translation(dx, dy))
 
     def rotate(self, radians, center=(0, 0)):
-        shape = self._get_shape()
-        shape.rotate(radians, center)
-        self._get_points_from_shape(shape)
+        self.transform(transform.rotation(radians, center))
 
     def scale(self, scalex, scaley=None, center=(0, 0)):
-        shape = self._get_shape()
-        shape.scale(scalex, scaley, center)
-        self._get_points_from_shape(shape)
+        self.transform(transform.scaling(scalex, scaley, center))
 
     def mirror(self, p1, p2=(0, 0)):
-        shape = self._get_shape()
-        shape.mirror(p1, p2)
-        self._get_points_from_shape(shape)
-
-    def _get_shape(self):
-        points = [p for p in self._points.values()]
-        return gdspy.Polygon(points)
+        self.transform(transform.reflection(p1, p2))
 
-    def _get_points_from_shape(self, shape):
-        point_lst = list(shape.polygons[0])
-        for i, name in enumerate(self._points.keys()):
-            self._points[name] = point_lst[i]
+    def copy(self):
+        result = Reference()
+        result._names = dict(self._names)
+        result._array = self._array[: len(self._names)].copy()
+        return result
 
     @property
     def points(self):
-        return self._points
+        return Points(self)
+
+
+class Points(Mapping):
+    # read-only view of the points of a `Reference`, returns copies
+    def __init__(self, reference):
+        self._reference = reference
+
+    def __getitem__(self, name):
+        return self._reference._array[self._reference._names[name]].copy()
+
+    def __iter__(self):
+        return iter(list(self._reference._names.keys()))
+
+    def __len__(self):
+        return len(self._reference._names)
+
+    def __repr__(self):
+        return repr(dict(self))
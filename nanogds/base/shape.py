@@ -1,54 +1,79 @@
 import gdspy
 import numpy as np
-from copy import deepcopy
+from copy import copy, deepcopy
 
+from . import arcs, packing, profiling, spatial, tiling, transform
+from .parametric import Parametric
 from .reference import Reference
 
+MAX_POINTS = 199  # vertices of polygons appended without a boolean, as in `gdspy`
+
+
+class Shape(metaclass=Parametric):
+    # record `add` operations and evaluate the booleans on first access
+    lazy = True
+    cache = None  # `ShapeCache` used for subclasses built with arguments
+    memo = None  # `ShapeMemo` sharing one prototype per arguments
+    cacheable = True
+    tiles = None  # (columns, rows) to evaluate booleans tile by tile
+    workers = 1  # processes for the tiles
+    min_tile_size = tiling.MIN_TILE_SIZE  # smaller layers are not tiled
+    skipped_booleans = 0  # additions of disjoint polygons without a boolean
+    tolerance = None  # maximum chord error of arcs, None for the gdspy defaults
+    grid = None  # e.g. 0.001 to snap all vertices to a 1 nm database unit
 
-class Shape:
     def __init__(self):
         self._reference = Reference()
         self._shapes = {}
+        self._pending = {}
+        self._children = []  # (shape, matrix) placed as cell references
+        self._boxes = {}  # layer: (polygons, bounding boxes)
+        self._affine = transform.identity()  # not yet applied to the polygons
+        self._key = None
+        self._matrix = transform.identity()
         self.add_reference("ORIGIN", (0, 0))
         self._draw()
 
     def translate(self, dx, dy):
-        for shape in self._shapes.values():
-            shape.translate(dx, dy)
-        self._reference.translate(dx, dy)
-        return self
+        return self._transform(transform.translation(dx, dy))
 
     def rotate(self, radians, center=(0, 0)):
-        for shape in self._shapes.values():
-            shape.rotate(radians, center)
-        self._reference.rotate(radians, center)
-        return self
+        return self._transform(transform.rotation(radians, center))
 
     def scale(self, scalex, scaley=None, center=(0, 0)):
-        for shape in self._shapes.values():
-            shape.scale(scalex, scaley, center)
-        self._reference.scale(scalex, scaley, center)
-        return self
+        return self._transform(transform.scaling(scalex, scaley, center))
 
     def mirror(self, p1, p2=(0, 0)):
-        for shape in self._shapes.values():
-            shape.mirror(p1, p2)
-        self._reference.mirror(p1, p2)
-        return self
+        return self._transform(transform.reflection(p1, p2))
 
     def fillet(self, radius):
+        self._key = None
+        self._flatten()
+        self._evaluate()
+        self._boxes = {}  # the polygons are changed in place
+        options = arcs.get_fillet_options(radius, self.tolerance)
         for shape in self._shapes.values():
-            shape.fillet(radius)
+            shape.fillet(radius, **options)
+            shape.polygons = transform.freeze(shape.polygons)
         return self
 
     def offset(self, distance):
+        self._key = None
+        self._flatten()
+        self._evaluate()
         for key, shape in self._shapes.items():
             self._shapes[key] = gdspy.offset(shape, distance)
+            if self._shapes[key] is not None:
+                polygons = transform.freeze(self._shapes[key].polygons)
+                self._shapes[key].polygons = polygons
         #self._reference.offset(distance)
         return self
 
     def change_layer(self, layer, original_layer=0):
         if isinstance(layer, int):
+            self._key = None
+            self._flatten()
+            self._evaluate()
             for shape in self._shapes.values():
                 shape.layers = [layer] * len(shape.layers)
             self._shapes = {layer: self._shapes[original_layer]}
@@ -64,65 +89,410 @@ class Shape:
         add_refs=False,
         counter=None,
         operation="or",
+        reference=False,
     ):
-        element = deepcopy(element)
-        if angle is not None:
-            element.rotate(angle)
-        if position is not None:
-            element.translate(position[0], position[1])
-
+        self._key = None
+        matrix = transform.placement(position, angle)
         if isinstance(element, Shape):
-            for l in element.layers:
-                self._add_polygonset(element._shapes[l], layer=l, operation=operation)
+            if operation.lower() != "or":
+                # booleans other than `or` need the flat geometry
+                for l, polygons in element._get_layer_polygons(matrix).items():
+                    self._add_polygonset(polygons, layer=l, operation=operation)
+            elif reference and element._key is not None:
+                self._children.append((element._copy(), matrix))
+            else:
+                element._evaluate()
+                for l, polygonset in element._shapes.items():
+                    polygons = transform.apply(matrix, _get_polygons(polygonset))
+                    self._add_polygonset(polygons, layer=l, operation=operation)
+                self._children += [(c, matrix @ m) for c, m in element._children]
             if add_refs:
-                self._merge_references(element, counter)
+                self._merge_references(element, counter, matrix)
         elif isinstance(element, gdspy.polygon.PolygonSet):
-            self._add_polygonset(element, layer, operation=operation)
+            # copied, the element may still be changed by the caller
+            polygons = transform.apply(matrix, element.polygons, copy=True)
+            self._add_polygonset(polygons, layer, operation=operation)
         elif isinstance(element, gdspy.FlexPath):
-            self._add_polygonset(element.get_polygons(), layer, operation=operation)
+            polygons = transform.apply(matrix, element.get_polygons(), copy=True)
+            self._add_polygonset(polygons, layer, operation=operation)
         else:
             raise Exception(
                 f"Element to add needs to be either a `Shape` or `gdspy.PolygonSet`. This is a {element}"
             )
 
+    def add_array(self, element, columns, rows, spacing, position=None, angle=None):
+        # `columns` x `rows` copies of a shape, placed as one cell array
+        matrix = transform.placement(position, angle)
+        array = ShapeArray(element._copy(), columns, rows, spacing)
+        self._key = None
+        if element._key is not None:
+            self._children.append((array, matrix))
+        else:
+            for l, polygons in array._get_layer_polygons(matrix).items():
+                self._add_polygonset(polygons, layer=l)
+
     def _add_polygonset(self, element, layer=0, operation="or"):
         operation = operation.lower()
         if operation not in ["or", "and", "not", "xor"]:
             raise Exception(f"Unknown operation '{operation}'")
+        self._key = None
+        self._apply_affine()
+        if operation != "or" and self._children:
+            self._flatten()
+        polygons = self._snap(_get_polygons(element))
+        if self.lazy:
+            self._pending.setdefault(layer, []).append((operation, polygons))
+            return
         if layer not in self._shapes.keys():
             self._shapes[layer] = gdspy.PolygonSet([], layer=layer)  # new layer
-        self._shapes[layer] = gdspy.boolean(
-            self._shapes[layer], element, operation, layer=layer
-        )
+        self._apply_operation(layer, polygons, operation)
+
+    def _evaluate(self):
+        self._apply_affine()
+        for layer, operations in self._pending.items():
+            if layer not in self._shapes.keys():
+                self._shapes[layer] = gdspy.PolygonSet([], layer=layer)  # new layer
+            for operation, polygons in _batch_operations(operations):
+                if not polygons and operation in ["or", "not"]:
+                    continue
+                self._apply_operation(layer, polygons, operation)
+        self._pending = {}
+
+    def _apply_operation(self, layer, polygons, operation):
+        # only the polygons whose bounding boxes touch the new ones take part
+        # in the boolean, the others are kept as they are
+        current, boxes = self._get_boxes(layer)
+        new_boxes = spatial.get_boxes(polygons)
+        touching = spatial.get_touching(boxes, new_boxes)
+        kept = np.flatnonzero(~touching if operation != "and" else [])
+        selected = [current[i] for i in np.flatnonzero(touching)]
+        if not selected and operation in ["and", "not"]:
+            result = []  # nothing to intersect with or subtract from
+            Shape.skipped_booleans += 1
+        elif (
+            not selected
+            and operation in ["or", "xor"]
+            and max((len(p) for p in polygons), default=0) <= MAX_POINTS
+            and spatial.are_disjoint(new_boxes)
+        ):
+            result = list(polygons)  # appended, merged later if they overlap
+            Shape.skipped_booleans += 1
+        else:
+            result = _get_polygons(self._boolean(selected, polygons, operation, layer))
+            new_boxes = spatial.get_boxes(result)
+        result = transform.freeze(result)  # the kept polygons already are
+        polygons = [current[i] for i in kept] + result
+        polygonset = _new_polygonset(polygons, layer, freeze=False)
+        self._shapes[layer] = polygonset
+        self._boxes[layer] = (polygonset.polygons, np.concatenate([boxes[kept], new_boxes]))
+
+    def merge(self):
+        # unites the polygons of every layer, including those appended
+        # without a boolean
+        self._evaluate()
+        for layer, polygonset in self._shapes.items():
+            result = self._boolean(polygonset, None, "or", layer)
+            self._shapes[layer] = _new_polygonset(_get_polygons(result), layer)
+        return self
+
+    def vertex_report(self):
+        # polygons and vertices per layer of the flat geometry
+        return arcs.get_counts(self._get_layer_polygons())
+
+    def _get_boxes(self, layer):
+        # bounding boxes of the polygons of a layer, valid as long as the
+        # layer keeps the list of polygons they were computed for
+        current = _get_polygons(self._shapes[layer], copy=False)
+        polygons, boxes = self._boxes.get(layer, (None, None))
+        if polygons is not current or len(boxes) != len(current):
+            boxes = spatial.get_boxes(current)
+            self._boxes[layer] = (current, boxes)
+        return current, boxes
+
+    def _boolean(self, first, second, operation, layer):
+        start = profiling.start()
+        # on the grid, clipper's integer coordinates are the snapped vertices
+        precision = 0.001 if self.grid is None else self.grid
+        if self.tiles is None:
+            result = gdspy.boolean(
+                first, second, operation, layer=layer, precision=precision
+            )
+        else:
+            result = tiling.boolean(
+                first,
+                second,
+                operation,
+                self.tiles,
+                layer=layer,
+                precision=precision,
+                workers=self.workers,
+                min_size=self.min_tile_size,
+            )
+        if start is not None:
+            name = type(self).__name__
+            profiling.record("boolean", name, layer, start, (first, second), (result,))
+        return result
+
+    def _flatten(self):
+        children, self._children = self._children, []
+        for child, matrix in children:
+            for l, polygons in child._get_layer_polygons(matrix).items():
+                self._add_polygonset(polygons, layer=l)
+
+    def _get_layer_polygons(self, matrix=None):
+        # flat geometry including the children, without modifying this shape
+        self._evaluate()
+        layer_polygons = {}
+        for l, polygonset in self._shapes.items():
+            polygons = transform.apply(matrix, _get_polygons(polygonset))
+            layer_polygons.setdefault(l, []).extend(polygons)
+        for child, child_matrix in self._children:
+            if matrix is not None:
+                child_matrix = matrix @ child_matrix
+            for l, polygons in child._get_layer_polygons(child_matrix).items():
+                layer_polygons.setdefault(l, []).extend(polygons)
+        return layer_polygons
+
+    def _transform(self, matrix):
+        # chained transformations are composed and applied to the polygons
+        # only once, when the geometry is needed
+        self._affine = matrix @ self._affine
+        self._matrix = matrix @ self._matrix
+        self._children = [(c, matrix @ m) for c, m in self._children]
+        self._reference.transform(matrix)
+        return self
+
+    def _apply_affine(self):
+        if transform.is_identity(self._affine):
+            return
+        matrix, self._affine = self._affine, transform.identity()
+        for layer, polygonset in self._shapes.items():
+            if polygonset is not None:
+                start = profiling.start()
+                polygonset.polygons = transform.freeze(
+                    self._snap(transform.apply(matrix, polygonset.polygons))
+                )
+                if start is not None:
+                    name = type(self).__name__
+                    profiling.record("transform", name, layer, start, (polygonset,))
+        for operations in self._pending.values():
+            operations[:] = [
+                (op, self._snap(transform.apply(matrix, p))) for op, p in operations
+            ]
+
+    def _snap(self, polygons):
+        if self.grid is None or not polygons:
+            return polygons
+        return transform.snap(polygons, self.grid)
 
     def add_reference(self, name, point):
         self._reference.add(name, point)
 
-    def _merge_references(self, element, counter):
-        for name, point in element.points.items():
-            if name == "ORIGIN":
-                continue
-            new_name = type(element).__name__.upper()
-            if counter is not None:
-                new_name += f" #{counter}"
-            new_name += f" {name}"
-            self.add_reference(new_name, point)
+    def _merge_references(self, element, counter, matrix=None):
+        new_name = type(element).__name__.upper()
+        if counter is not None:
+            new_name += f" #{counter}"
+        self._reference.merge(element._reference, new_name, matrix)
+
+    def find_points(self, prefix=""):
+        return self._reference.find(prefix)
+
+    def _copy(self):
+        # shares the vertex arrays, see `transform.copy_polygonset`
+        self._evaluate()
+        start = profiling.start()
+        result = copy(self)
+        result._shapes = {
+            l: None if s is None else transform.copy_polygonset(s)
+            for l, s in self._shapes.items()
+        }
+        result._pending = {}
+        result._children = list(self._children)
+        result._boxes = {
+            l: (result._shapes[l].polygons, boxes)  # same vertex arrays
+            for l, (polygons, boxes) in self._boxes.items()
+            if self._shapes.get(l) is not None and self._shapes[l].polygons is polygons
+        }
+        result._reference = self._reference.copy()
+        if start is not None:
+            polygonsets = self._shapes.values()
+            profiling.record("copy", type(self).__name__, None, start, polygonsets)
+        return result
+
+    def _get_state(self, children=False):
+        # flat geometry, references and the attributes set by subclasses; with
+        # `children` the children are stored as they are, together with the
+        # construction key and matrix, instead of being merged
+        if children:
+            self._evaluate()
+            layer_polygons = {
+                l: _get_polygons(s, copy=False) for l, s in self._shapes.items()
+            }
+        else:
+            layer_polygons = self._get_layer_polygons()
+        layers = [l for l, polygons in layer_polygons.items() for _ in polygons]
+        vertices, offsets = packing.pack(
+            [p for polygons in layer_polygons.values() for p in polygons]
+        )
+        names, points = self._reference.find()
+        attributes = {k: v for k, v in vars(self).items() if k not in _INTERNAL}
+        state = {
+            "attributes": packing.pack_object(attributes),
+            "shape_layers": np.array(list(self._shapes.keys()), dtype=int),
+            "layers": np.array(layers, dtype=int),
+            "vertices": vertices,
+            "offsets": offsets,
+            "reference_names": np.array(names, dtype=str),
+            "reference_points": points,
+        }
+        if children:
+            state["children"] = packing.pack_object(self._children)
+            state["key"] = packing.pack_object(self._key)
+            state["matrix"] = self._matrix
+        return state
+
+    def _set_state(self, state):
+        self._reference = Reference()
+        self._reference.extend(
+            state["reference_names"].tolist(), state["reference_points"]
+        )
+        polygons = packing.unpack(state["vertices"], state["offsets"])
+        self._shapes = {}
+        for l in state["shape_layers"].tolist() + state["layers"].tolist():
+            if l not in self._shapes:
+                self._shapes[l] = _new_polygonset(
+                    [p for p, pl in zip(polygons, state["layers"]) if pl == l], l
+                )
+        self._pending = {}
+        self._children = []
+        self._boxes = {}
+        self._affine = transform.identity()
+        self._key = None
+        self._matrix = transform.identity()
+        if "children" in state:
+            self._children = packing.unpack_object(state["children"])
+            self._key = packing.unpack_object(state["key"])
+            self._matrix = np.array(state["matrix"])
+        vars(self).update(packing.unpack_object(state["attributes"]))
+
+    def to_bytes(self):
+        # geometry, children and references as one buffer
+        return packing.pack_arrays(self._get_state(children=True))
+
+    @classmethod
+    def from_bytes(cls, data):
+        # the polygons are read-only views of `data`, like the vertex arrays
+        # of all shapes
+        shape = cls.__new__(cls)
+        shape._set_state(packing.unpack_arrays(data))
+        return shape
+
+    def __reduce__(self):
+        return _from_bytes, (type(self), self.to_bytes())
+
+    def __copy__(self):
+        # `copy` and `deepcopy` keep the attributes instead of the state
+        result = type(self).__new__(type(self))
+        vars(result).update(vars(self))
+        return result
+
+    def __deepcopy__(self, memo):
+        result = type(self).__new__(type(self))
+        memo[id(self)] = result
+        vars(result).update(deepcopy(vars(self), memo))
+        return result
 
     def _draw(self):
         pass
 
     @property
     def shapes(self):
+        self._flatten()
+        self._evaluate()
+        # the polygon sets may be changed by the caller
+        self._boxes = {}
+        self._key = None
         return list(self._shapes.values())
 
     @property
     def layers(self):
-        return list(self._shapes.keys())
+        # read without merging the children
+        return list(self._get_layer_polygons().keys())
 
     @property
     def polygons(self):
-        return [shape.polygons for shape in self._shapes.values()]
+        return list(self._get_layer_polygons().values())
 
     @property
     def points(self):
         return self._reference.points
+
+
+class ShapeArray:
+    # copies of `shape` at `spacing` along x (columns) and y (rows)
+    def __init__(self, shape, columns, rows, spacing):
+        self._shape = shape
+        self._columns = columns
+        self._rows = rows
+        self._spacing = spacing
+        self._key = shape._key
+        self._matrix = shape._matrix
+
+    def _get_offsets(self):
+        i, j = np.meshgrid(np.arange(self._columns), np.arange(self._rows))
+        return np.stack([i.ravel() * self._spacing[0], j.ravel() * self._spacing[1]], 1)
+
+    def _get_layer_polygons(self, matrix=None):
+        offsets = self._get_offsets()
+        layer_polygons = {}
+        for l, polygons in self._shape._get_layer_polygons().items():
+            for p in polygons:
+                copies = np.asarray(p)[None, :, :] + offsets[:, None, :]
+                copies = transform.apply(matrix, [copies.reshape(-1, 2)])[0]
+                layer_polygons.setdefault(l, []).extend(copies.reshape(len(offsets), -1, 2))
+        return layer_polygons
+
+
+_INTERNAL = [
+    "_reference",
+    "_shapes",
+    "_pending",
+    "_children",
+    "_boxes",
+    "_affine",
+    "_key",
+    "_matrix",
+]
+
+
+def _get_polygons(element, copy=True):
+    if element is None:
+        return []
+    if isinstance(element, gdspy.polygon.PolygonSet):
+        return list(element.polygons) if copy else element.polygons
+    return list(element)
+
+
+def _from_bytes(cls, data):
+    return cls.from_bytes(data)
+
+
+def _new_polygonset(polygons, layer, freeze=True):
+    # unlike the constructor, keeps the vertex arrays (as read-only views)
+    polygonset = gdspy.PolygonSet([], layer=layer)
+    polygonset.polygons = transform.freeze(polygons) if freeze else polygons
+    polygonset.layers = [layer] * len(polygons)
+    polygonset.datatypes = [0] * len(polygons)
+    return polygonset
+
+
+def _batch_operations(operations):
+    # consecutive unions (A | B | C = A | (B + C)) and subtractions
+    # (A - B - C = A - (B + C)) are evaluated in a single clipper call
+    batches = []
+    for operation, polygons in operations:
+        if batches and operation in ["or", "not"] and batches[-1][0] == operation:
+            batches[-1][1].extend(polygons)
+        else:
+            batches.append((operation, list(polygons)))
+    return batches
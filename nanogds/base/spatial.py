@@ -0,0 +1,64 @@
+import numpy as np
+
+from . import packing
+
+# number of box pairs compared at once
+CHUNK_SIZE = 2 ** 20
+
+
+def get_boxes(polygons):
+    # (N, 4) array of the bounding boxes (xmin, ymin, xmax, ymax)
+    if not polygons:
+        return np.zeros((0, 4))
+    vertices, offsets = packing.pack(polygons)
+    return np.concatenate(
+        [
+            np.minimum.reduceat(vertices, offsets[:-1], axis=0),
+            np.maximum.reduceat(vertices, offsets[:-1], axis=0),
+        ],
+        axis=1,
+    )
+
+
+def get_touching(boxes, queries):
+    # mask of the `boxes` that overlap or touch any of the `queries`; boxes
+    # outside of the bounding box of all queries are discarded first
+    if not len(boxes) or not len(queries):
+        return np.zeros(len(boxes), dtype=bool)
+    touching = _touches(boxes, queries[:, :2].min(axis=0), queries[:, 2:].max(axis=0))
+    candidates = np.flatnonzero(touching)
+    if len(queries) == 1 or not len(candidates):
+        return touching
+    touching[:] = False
+    step = max(1, CHUNK_SIZE // len(candidates))
+    for i in range(0, len(queries), step):
+        chunk = queries[i : i + step]
+        pairs = _touches(
+            boxes[candidates, None, :], chunk[None, :, :2], chunk[None, :, 2:]
+        )
+        touching[candidates] |= pairs.any(axis=1)
+    return touching
+
+
+def are_disjoint(boxes):
+    # True if no two boxes overlap or touch; also False if too many pairs of
+    # boxes overlap along x to be compared at once
+    boxes = boxes[np.argsort(boxes[:, 0], kind="stable")]
+    ends = np.searchsorted(boxes[:, 0], boxes[:, 2], side="right")
+    counts = ends - np.arange(len(boxes)) - 1  # following boxes overlapping in x
+    if counts.sum() > CHUNK_SIZE:
+        return False
+    first = np.repeat(np.arange(len(boxes)), counts)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return not np.any(
+        (boxes[first, 1] <= boxes[second, 3]) & (boxes[first, 3] >= boxes[second, 1])
+    )
+
+
+def _touches(boxes, low, high):
+    return (
+        (boxes[..., 0] <= high[..., 0])
+        & (boxes[..., 2] >= low[..., 0])
+        & (boxes[..., 1] <= high[..., 1])
+        & (boxes[..., 3] >= low[..., 1])
+    )
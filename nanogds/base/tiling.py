@@ -0,0 +1,140 @@
+import gdspy
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from . import packing
+from .spatial import get_boxes
+
+MIN_TILE_SIZE = 100  # default smallest tile width and height, in user units
+
+_executors = {}  # workers: `ProcessPoolExecutor` shared by all booleans
+
+
+def boolean(
+    first,
+    second,
+    operation,
+    tiles,
+    layer=0,
+    precision=0.001,
+    workers=1,
+    min_size=MIN_TILE_SIZE,
+):
+    # `gdspy.boolean` evaluated separately on a grid of `tiles` (columns, rows)
+    # over the bounding box of both operands. Every tile only receives the
+    # polygons whose bounding boxes reach into it and its result is clipped
+    # to the tile, so polygons crossing tile borders are split there. Tiles
+    # are at least `min_size` wide and high, operands fitting into one tile
+    # are not split at all.
+    first, second = _get_polygons(first), _get_polygons(second)
+    if not first and not second:
+        return None
+    columns, rows = (tiles, tiles) if np.isscalar(tiles) else tiles
+    boxes = get_boxes(first + second)
+    low, high = boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0)
+    if min_size:
+        width, height = (high - low) / min_size
+        columns = max(1, min(columns, int(width)))
+        rows = max(1, min(rows, int(height)))
+    if columns == 1 and rows == 1:
+        return gdspy.boolean(first, second, operation, layer=layer, precision=precision)
+    xs = np.linspace(low[0], high[0], columns + 1)
+    ys = np.linspace(low[1], high[1], rows + 1)
+    jobs = []
+    for j, i, selected in _get_tile_polygons(boxes, xs, ys):
+        tile = np.array([xs[i], ys[j], xs[i + 1], ys[j + 1]])
+        a = [first[k] for k in selected[selected < len(first)]]
+        b = [second[k - len(first)] for k in selected[selected >= len(first)]]
+        if not a and (operation in ["and", "not"] or not b):
+            continue
+        if not b and operation == "and":
+            continue
+        # polygons inside the tile cannot produce anything outside of it
+        clip = not _contains(tile, boxes[selected]).all()
+        jobs.append(
+            (packing.pack(a), packing.pack(b), operation, tile, clip, precision)
+        )
+    if workers == 1:
+        results = map(_boolean_tile, jobs)
+        polygons = [p for result in results for p in packing.unpack(*result)]
+    else:
+        results = get_executor(workers).map(_boolean_tile, jobs)
+        polygons = [p for result in results for p in packing.unpack(*result)]
+    if not polygons:
+        return None
+    return gdspy.PolygonSet(polygons, layer=layer)
+
+
+def get_executor(workers):
+    # the worker processes are started once and reused
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _executors[workers]
+
+
+def shutdown():
+    # stops the worker processes, they are started again when needed
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+
+
+def _boolean_tile(job):
+    first, second, operation, tile, clip, precision = job
+    result = gdspy.boolean(
+        packing.unpack(*first), packing.unpack(*second), operation, precision=precision
+    )
+    if result is not None and clip:
+        result = gdspy.boolean(
+            result, gdspy.Rectangle(tile[:2], tile[2:]), "and", precision=precision
+        )
+    return packing.pack([] if result is None else result.polygons)
+
+
+def _get_tile_polygons(boxes, xs, ys):
+    # row, column and indices of the polygons of every tile with polygons.
+    # Boxes only touching a tile at its border do not belong to it, so that
+    # every polygon inside one tile is only handled by that tile. Polygons
+    # within one tile are sorted into their tiles at once, the few spanning
+    # several tiles are checked tile by tile.
+    columns, rows = len(xs) - 1, len(ys) - 1
+    i0 = np.clip(np.searchsorted(xs, boxes[:, 0], "right") - 1, 0, columns - 1)
+    i1 = np.clip(np.searchsorted(xs, boxes[:, 2], "left") - 1, 0, columns - 1)
+    j0 = np.clip(np.searchsorted(ys, boxes[:, 1], "right") - 1, 0, rows - 1)
+    j1 = np.clip(np.searchsorted(ys, boxes[:, 3], "left") - 1, 0, rows - 1)
+    single = (i0 == i1) & (j0 == j1)
+    inside = np.flatnonzero(single)
+    tiles = j0[inside] * columns + i0[inside]
+    order = np.argsort(tiles, kind="stable")
+    inside, tiles = inside[order], tiles[order]
+    bounds = np.searchsorted(tiles, np.arange(columns * rows + 1))
+    spanning = np.flatnonzero(~single)
+    for j in range(rows):
+        for i in range(columns):
+            k = j * columns + i
+            selected = spanning[
+                (i0[spanning] <= i)
+                & (i1[spanning] >= i)
+                & (j0[spanning] <= j)
+                & (j1[spanning] >= j)
+            ]
+            if len(selected) or bounds[k] < bounds[k + 1]:
+                selected = np.append(inside[bounds[k] : bounds[k + 1]], selected)
+                yield j, i, np.sort(selected)
+
+
+def _contains(box, boxes):
+    return (
+        (boxes[:, 0] >= box[0])
+        & (boxes[:, 1] >= box[1])
+        & (boxes[:, 2] <= box[2])
+        & (boxes[:, 3] <= box[3])
+    )
+
+
+def _get_polygons(element):
+    if element is None:
+        return []
+    if isinstance(element, gdspy.polygon.PolygonSet):
+        element = element.polygons
+    return [np.asarray(p, dtype=float) for p in element]
@@ -0,0 +1,138 @@
+import gdspy
+import numpy as np
+from copy import copy, deepcopy
+
+from . import packing, profiling
+
+
+_IDENTITY = np.identity(3)
+_IDENTITY.flags.writeable = False  # shared by all shapes
+
+
+def identity():
+    return _IDENTITY
+
+
+def translation(dx, dy):
+    return np.array([[1.0, 0.0, dx], [0.0, 1.0, dy], [0.0, 0.0, 1.0]])
+
+
+def rotation(radians, center=(0, 0)):
+    c, s = np.cos(radians), np.sin(radians)
+    matrix = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+    return _about(matrix, center)
+
+
+def scaling(scalex, scaley=None, center=(0, 0)):
+    scaley = scalex if scaley is None else scaley
+    matrix = np.array([[scalex, 0.0, 0.0], [0.0, scaley, 0.0], [0.0, 0.0, 1.0]])
+    return _about(matrix, center)
+
+
+def reflection(p1, p2=(0, 0)):
+    # reflection over the line through p1 and p2 (same as `gdspy` mirror)
+    vec = np.array(p2, dtype=float) - np.array(p1, dtype=float)
+    linear = 2 * np.outer(vec, vec) / np.inner(vec, vec) - np.identity(2)
+    matrix = np.identity(3)
+    matrix[:2, :2] = linear
+    return _about(matrix, p1)
+
+
+def placement(position=None, angle=None):
+    # rotation around the origin followed by a translation to `position`
+    matrix = identity()
+    if angle is not None:
+        matrix = rotation(angle)
+    if position is not None:
+        matrix = translation(position[0], position[1]) @ matrix
+    return matrix
+
+
+def is_identity(matrix):
+    return matrix is None or matrix is _IDENTITY or np.array_equal(matrix, _IDENTITY)
+
+
+def apply(matrix, polygons, copy=False):
+    # returns new vertex arrays; the input arrays are shared if nothing changes
+    # unless `copy` is set
+    if is_identity(matrix):
+        if copy:
+            return [np.array(p, dtype=float) for p in polygons]
+        return list(polygons)
+    linear, offset = matrix[:2, :2].T, matrix[:2, 2]
+    return [np.asarray(p) @ linear + offset for p in polygons]
+
+
+def snap(polygons, grid):
+    # vertices rounded to multiples of `grid`, in one array operation
+    vertices, offsets = packing.pack(polygons)
+    return packing.unpack(np.round(vertices / grid) * grid, offsets)
+
+
+def decompose(matrix, tolerance=1e-9):
+    # origin, rotation (degrees), magnification and x reflection of a GDSII
+    # reference, or None if the matrix shears or scales non-uniformly
+    linear = matrix[:2, :2]
+    determinant = np.linalg.det(linear)
+    if abs(determinant) < tolerance:
+        return None
+    x_reflection = determinant < 0
+    if x_reflection:
+        linear = linear @ np.diag([1.0, -1.0])
+    magnification = np.sqrt(abs(determinant))
+    linear = linear / magnification
+    if not np.allclose(linear.T @ linear, np.identity(2), atol=tolerance):
+        return None
+    rotation = np.degrees(np.arctan2(linear[1, 0], linear[0, 0]))
+    return (
+        (matrix[0, 2], matrix[1, 2]),
+        None if abs(rotation) < tolerance else rotation,
+        None if abs(magnification - 1) < tolerance else magnification,
+        x_reflection,
+    )
+
+
+def _about(matrix, center):
+    if center[0] == 0 and center[1] == 0:
+        return matrix
+    return translation(center[0], center[1]) @ matrix @ translation(-center[0], -center[1])
+
+
+# Copy-on-write helpers: `gdspy` never modifies vertex arrays in place (all
+# transformations rebind `polygons`), so copies only need their own containers
+# and can share the vertex arrays with the original. Shapes keep their arrays
+# read-only (see `freeze`); polygons are changed by replacing the arrays.
+
+
+def freeze(polygons):
+    # read-only views of the vertex arrays stored in shapes, so that a shape
+    # cannot change the polygons it shares with others in place
+    result = []
+    for p in polygons:
+        p = np.asarray(p, dtype=float)
+        if p.flags.writeable:
+            p = p.view()
+            p.flags.writeable = False
+        result.append(p)
+    return result
+
+
+def copy_polygonset(polygonset, matrix=None):
+    result = copy(polygonset)
+    result.polygons = apply(matrix, polygonset.polygons)
+    result.layers = list(polygonset.layers)
+    result.datatypes = list(polygonset.datatypes)
+    result.properties = dict(getattr(polygonset, "properties", {}))
+    return result
+
+
+def copy_element(element):
+    if isinstance(element, gdspy.PolygonSet):
+        return copy_polygonset(element)
+    if isinstance(element, (gdspy.CellReference, gdspy.CellArray, gdspy.Label)):
+        return copy(element)
+    start = profiling.start()
+    result = deepcopy(element)
+    if start is not None:
+        profiling.record("copy", type(element).__name__, None, start)
+    return result
@@ -0,0 +1,68 @@
+import gdspy
+
+from . import profiling
+
+
+class StreamWriter:
+    # Writes cells to the file as soon as they are finished, after the cells
+    # they reference, and releases their contents. Parents only need the names
+    # of released cells to write their references.
+    def __init__(self, filename, library, keep=()):
+        self._writer = gdspy.GdsWriter(
+            filename,
+            name=library.name,
+            unit=library.unit,
+            precision=library.precision,
+        )
+        self._written = set()
+        self._keep = keep  # names of cells that are written but not released
+
+    def write(self, cell):
+        for c in _get_write_order(cell, self._written):
+            start = profiling.start()
+            self._writer.write_cell(c)
+            if start is not None:
+                profiling.record("write", c.name, None, start, c.polygons)
+            self._written.add(c.name)
+            if c.name not in self._keep:
+                _release(c)
+
+    def is_written(self, name):
+        return name in self._written
+
+    def close(self, library=None, binary_cells=()):
+        # writes the remaining cells of `library` and the already encoded
+        # `binary_cells` before closing the file
+        if library is not None:
+            for cell in list(library.cells.values()):
+                self.write(cell)
+        self._writer.write_binary_cells(binary_cells)
+        self._writer.close()
+
+
+def _get_write_order(cell, written):
+    # cells not yet written, children before parents
+    order, visited = [], set()
+    stack = [(cell, False)]
+    while stack:
+        c, expanded = stack.pop()
+        if expanded:
+            order.append(c)
+            continue
+        if c.name in written or c.name in visited:
+            continue
+        visited.add(c.name)
+        stack.append((c, True))
+        for reference in c.references:
+            if isinstance(reference.ref_cell, gdspy.Cell):
+                stack.append((reference.ref_cell, False))
+    return order
+
+
+def _release(cell):
+    cell.polygons = []
+    cell.paths = []
+    cell.labels = []
+    cell.references = []
+    cell._bb_valid = False
+    cell._bounding_box = None
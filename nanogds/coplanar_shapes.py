@@ -1,5 +1,5 @@
 import nanogds
-from .base import CoplanarShape
+from .base import CoplanarShape, arcs
 from .shapes import Rectangle
 
 import gdspy
@@ -10,6 +10,8 @@ PI = np.pi
 
 
 class CoplanarPath(CoplanarShape):
+    cacheable = False  # the paths are extended after construction
+
     def __init__(self, width_center, width_gap, radius, ground_offset):
         self._width_center = width_center
         self._width_gap = width_gap
@@ -30,6 +32,7 @@ class CoplanarPath(CoplanarShape):
         self.add_reference("END", [self._center[0].x, self._center[0].y])
 
     def turn(self, *args, **kwargs):
+        kwargs = {**arcs.get_options(self.tolerance), **kwargs}
         for path in [self._ground[0], self._outer[0], self._center[0]]:
             path.turn(self._radius, *args, **kwargs)
         self.add_reference("END", [self._center[0].x, self._center[0].y])
@@ -234,10 +237,11 @@ class Inductor(CoplanarShape):
 
 
 class LCFilter(CoplanarShape):
-    def __init__(self, w, g, l, n_c, n_i, w_i=None, l_i=None):
+    def __init__(self, w, g, l, n_c, n_i, w_i=None, l_i=None, ground_offset=0):
         self._w, self._g, self._l, self._n_c, self._n_i = w, g, l, n_c, n_i
         self._w_i = w_i
         self._l_i = l_i
+        self._ground_offset = ground_offset
         super().__init__()
 
     def _draw(self):
@@ -245,10 +249,12 @@ class LCFilter(CoplanarShape):
         self.combine(finger_cap, add_refs=True)
         self.combine(finger_cap.mirror((0, 1)))
         if self._w_i is not None:
-            inductor = Inductor(self._w_i, self._l_i, self._g, self._n_i)
-        self.combine(
-            inductor,
-            position=self.points["IDFCAPACITOR TOP"],
-            connect_point=inductor.points["BOTTOM"],
-            add_refs=True,
-        )
+            inductor = Inductor(
+                self._w_i, self._l_i, self._g, self._n_i, self._ground_offset
+            )
+            self.combine(
+                inductor,
+                position=self.points["IDFCAPACITOR TOP"],
+                connect_point=inductor.points["BOTTOM"],
+                add_refs=True,
+            )
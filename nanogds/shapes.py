@@ -1,5 +1,5 @@
 import nanogds
-from .base import Shape, Reference
+from .base import Shape, Reference, arcs, raster
 
 import gdspy
 import numpy as np
@@ -15,7 +15,8 @@ class Circle(Shape):
 
     def _draw(self):
         self.add(
-            gdspy.Round((0, 0), (self._radius)), layer=self._layer,
+            gdspy.Round((0, 0), self._radius, **arcs.get_options(self.tolerance)),
+            layer=self._layer,
         )
         self.add_reference("CENTER", (0, 0))
         
@@ -191,7 +192,17 @@ class Angle(Shape):
 
 class MarkerField(Shape):
     def __init__(
-        self, size, nx, ny, pitch, pitchy=None, correction=0, label=False, layer=0
+        self,
+        size,
+        nx,
+        ny,
+        pitch,
+        pitchy=None,
+        correction=0,
+        label=False,
+        layer=0,
+        hierarchical=False,
+        sites=None,
     ):
         self._size = size
         self._nx = nx
@@ -201,38 +212,50 @@ class MarkerField(Shape):
         self._with_label = label
         self._layer = layer
         self._correction = correction
+        self._hierarchical = hierarchical
+        # boolean (nx, ny) array of the positions with a marker
+        self._sites = np.ones((nx, ny), dtype=bool) if sites is None else sites
         super().__init__()
 
     def _draw(self):
-        for i in range(self._nx):
-            for j in range(self._ny):
-                position = (i * self._pitch, j * self._pitchy)
+        sites = np.asarray(self._sites, dtype=bool)
+        marker = Marker(self._size, layer=self._layer, correction=self._correction)
+        if self._hierarchical:
+            # one cell array per rectangular block of present markers
+            for j, i, rows, columns in raster.get_blocks(sites.T).T:
+                self.add_array(
+                    marker,
+                    columns,
+                    rows,
+                    (self._pitch, self._pitchy),
+                    position=(i * self._pitch, j * self._pitchy),
+                )
+        for i, j in zip(*np.nonzero(sites)):
+            position = (i * self._pitch, j * self._pitchy)
+            if not self._hierarchical:
+                self.add(marker, position=position)
+            self.add_reference(f"MARKER_{i+1}_{j+1}", position)
+            if self._with_label:
                 self.add(
-                    Marker(self._size, layer=self._layer, correction=self._correction),
-                    position=position,
+                    gdspy.Text(
+                        f"{i+1}",
+                        2 * self._size,
+                        position=(position[0] - 1.5 * self._size, position[1]),
+                    ),
+                    layer=self._layer,
                 )
-                self.add_reference(f"MARKER_{i+1}_{j+1}", position)
-                if self._with_label:
+                if j != i:
                     self.add(
                         gdspy.Text(
-                            f"{i+1}",
+                            f"{j+1}",
                             2 * self._size,
-                            position=(position[0] - 1.5 * self._size, position[1]),
+                            position=(
+                                position[0] + 0.5 * self._size,
+                                position[1] - 2.5 * self._size,
+                            ),
                         ),
                         layer=self._layer,
                     )
-                    if j != i:
-                        self.add(
-                            gdspy.Text(
-                                f"{j+1}",
-                                2 * self._size,
-                                position=(
-                                    position[0] + 0.5 * self._size,
-                                    position[1] - 2.5 * self._size,
-                                ),
-                            ),
-                            layer=self._layer,
-                        )
 
     def add_corners(self):
         angle = Shape()
@@ -247,9 +270,11 @@ class MarkerField(Shape):
         cross = Shape()
         for i in range(4):
             cross.add(angle.rotate(i * PI / 2))
-        corners = [(1, 1), (1, self._nx), (self._nx, self._ny), (self._nx, 1)]
+        corners = [(1, 1), (1, self._ny), (self._nx, self._ny), (self._nx, 1)]
+        sites = np.asarray(self._sites, dtype=bool)
         for i, j in corners:
-            self.add(cross, position=self.points[f"MARKER_{i}_{j}"])
+            if sites[i - 1, j - 1]:  # not left out through `sites`
+                self.add(cross, position=self.points[f"MARKER_{i}_{j}"])
 
     def add_connection_points(self, n, side="bottom"):
         gridx = np.linspace(0, self._pitch * (self._nx - 1), n + 2)[1:-1]
@@ -284,18 +309,25 @@ class BondpadShape(Shape):
 
 
 class BondpadRow(Shape):
-    def __init__(self, positions, pad_width=200, pad_height=300, layer=0):
+    def __init__(
+        self, positions, pad_width=200, pad_height=300, layer=0, hierarchical=False
+    ):
         self._positions = positions
         self._pad_width = pad_width
         self._pad_height = pad_height
         self._layer = layer
+        self._hierarchical = hierarchical
         super().__init__()
 
     def _draw(self):
         for i, x in enumerate(self._positions):
             bondpad = BondpadShape(self._pad_width, self._pad_height, layer=self._layer)
             self.add(
-                bondpad, position=[x, 0], add_refs=True, counter=i + 1,
+                bondpad,
+                position=[x, 0],
+                add_refs=True,
+                counter=i + 1,
+                reference=self._hierarchical,
             )
 
 
@@ -326,11 +358,14 @@ class Lead(Shape):
 
 
 class LeadRow(Shape):
-    def __init__(self, point_list, widths, layer=0, layer_bondpad=1):
+    def __init__(
+        self, point_list, widths, layer=0, layer_bondpad=1, hierarchical=False
+    ):
         self._point_list = point_list
         self._widths = widths
         self._layer = layer
         self._layer_bondpad = layer_bondpad
+        self._hierarchical = hierarchical
         super().__init__()
 
     def _draw(self):
@@ -345,5 +380,5 @@ class LeadRow(Shape):
                 layer=self._layer,
                 layer_bondpad=self._layer_bondpad,
             )
-            self.add(lead)
+            self.add(lead, reference=self._hierarchical)
 
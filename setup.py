@@ -32,7 +32,7 @@ setuptools.setup(
         "Topic :: Scientific/Engineering",
     ],
     keywords="gds gdspy",
-    packages=["nanogds"],
+    packages=["nanogds", "nanogds.base", "nanogds.resources"],
     use_scm_version=True,
     setup_requires=["setuptools_scm"],
     install_requires=requirements,
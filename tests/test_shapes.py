@@ -0,0 +1,511 @@
+import gdspy
+import json
+import os
+import pickle
+import time
+import numpy as np
+import pytest
+
+import nanogds
+
+SHAPES = [
+    (nanogds.Circle, (10,)),
+    (nanogds.Square, (10,)),
+    (nanogds.Rectangle, (10, 20)),
+    (nanogds.Cross, (10, 2)),
+    (nanogds.Wedge, (5, 20)),
+    (nanogds.WedgeMarker, (5, 20)),
+    (nanogds.Marker, (5,)),
+    (nanogds.Angle, (5, 20)),
+    (nanogds.MarkerField, (5, 3, 2, 50)),
+    (nanogds.BondpadShape, (100, 150)),
+    (nanogds.BondpadRow, ([0, 300],)),
+    (nanogds.Lead, ([(0, 0), (100, 0), (100, 100)], [10, 5])),
+    (nanogds.LeadRow, ([[(0, 0), (100, 0)], [(0, 300), (100, 300)]], [10, 5])),
+    (nanogds.RectangleCapacitor, (50, 20, 5, 20)),
+    (nanogds.Bondpad, (100, 100, 20, 50, 10, 6, 20)),
+    (nanogds.RectangleBondpad, (100, 100, 20, 20)),
+    (nanogds.FingerCapacitor, ()),
+    (nanogds.IDFCapacitor, (2, 20, 2, 4)),
+    (nanogds.Inductor, (2, 20, 2, 4, 20)),
+    (nanogds.LCFilter, (2, 2, 20, 4, 4)),
+    (nanogds.LCFilter, (2, 2, 20, 4, 4, 2, 20)),
+]
+
+
+def get_polygons(cls, args):
+    shape = cls(*args)
+    if isinstance(shape, nanogds.CoplanarShape):
+        shape = shape.get_shape()
+    return [p for polygons in shape.polygons for p in polygons]
+
+
+@pytest.mark.parametrize("cls, args", SHAPES)
+def test_build(cls, args):
+    polygons = get_polygons(cls, args)
+    assert polygons
+    assert all(np.isfinite(p).all() for p in polygons)
+
+
+def test_coplanar_path():
+    path = nanogds.CoplanarPath(10, 6, 40, 20)
+    path.segment(100)
+    path.turn("l")
+    path.segment(50)
+    assert path.get_shape().polygons
+    assert np.allclose(path.points["END"], [path._center[0].x, path._center[0].y])
+
+
+def test_combine_and_transform():
+    path = nanogds.CoplanarPath(10, 6, 40, 20)
+    path.segment(100)
+    combined = nanogds.CoplanarShape()
+    combined.combine(path, position=[0, 0])
+    combined.combine(nanogds.FingerCapacitor(), position=[100, 0])
+    combined.rotate(np.pi / 2)
+    bounding_box = gdspy.PolygonSet(
+        [p for polygons in combined.get_shape().polygons for p in polygons]
+    ).get_bounding_box()
+    assert np.allclose(bounding_box[:, 0], [-31, 31])
+    assert np.allclose(bounding_box[:, 1], [0, 150])
+
+
+def test_combine_keeps_element_types():
+    inductor = nanogds.Inductor(2, 20, 2, 4, 20)
+    combined = nanogds.CoplanarShape()
+    combined.combine(inductor, position=[10, 0])
+    combined.combine(nanogds.CoplanarPath(10, 6, 40, 20))
+    types = [type(s) for s in combined._center]
+    assert types == [type(s) for s in inductor._center] + [gdspy.Path]
+
+
+def test_holes_follow_transformations():
+    shape = nanogds.CoplanarShape()
+    shape.add_to_holes(gdspy.Rectangle((0, 0), (1, 1)))
+    combined = nanogds.CoplanarShape()
+    combined.combine(shape, position=[10, 0])
+    combined.translate(0, 5)
+    assert np.allclose(combined._holes[0].get_bounding_box(), [[10, 5], [11, 6]])
+
+
+def test_copies_do_not_share_writable_arrays():
+    rectangle = nanogds.Rectangle(1, 2)
+    shape = nanogds.Shape()
+    shape.add(rectangle)
+    with pytest.raises(ValueError):
+        shape.polygons[0][0][0, 0] = 7
+    polygon = gdspy.Rectangle((0, 0), (1, 1))
+    shape.add(polygon, layer=1)
+    polygon.polygons[0][0, 0] = 7
+    assert shape.polygons[1][0].min() == 0
+
+
+@pytest.mark.parametrize("layer", [0, 2])
+def test_hole_array(layer):
+    shape = nanogds.CoplanarShape()
+    shape.add_to_ground(gdspy.Rectangle((0, 0), (100, 100)))
+    shape.add_hole_array(10, 2, layer=layer)
+    result = shape.get_shape()
+    areas = {
+        l: gdspy.PolygonSet(p).area() for l, p in zip(result.layers, result.polygons)
+    }
+    if layer == 0:
+        assert np.isclose(areas[0], 100 * 100 - 81 * 4)
+    else:
+        assert np.isclose(areas[0], 100 * 100) and np.isclose(areas[layer], 81 * 4)
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+@pytest.mark.parametrize("operation", ["or", "xor", "not", "and"])
+def test_empty_operand(lazy, operation, monkeypatch):
+    monkeypatch.setattr(nanogds.Shape, "lazy", lazy)
+    shape = nanogds.Shape()
+    shape.add(nanogds.Square(2))
+    shape.add(gdspy.PolygonSet([]), operation=operation)
+    area = sum(gdspy.PolygonSet(p).area() for p in shape.polygons)
+    assert np.isclose(area, 0 if operation == "and" else 4)
+
+
+def test_memo_prototype_is_protected(monkeypatch):
+    monkeypatch.setattr(nanogds.Shape, "memo", nanogds.ShapeMemo())
+    marker = nanogds.Marker(5)
+    with pytest.raises(ValueError):
+        marker.polygons[0][0][0, 0] = 999
+    marker.shapes[0].polygons[0] = marker.polygons[0][0] + 999
+    assert nanogds.Marker(5).polygons[0][0].max() < 999
+
+
+def test_small_booleans_are_not_tiled(monkeypatch):
+    monkeypatch.setattr(nanogds.Shape, "tiles", 4)
+    shape = nanogds.Shape()
+    shape.add(nanogds.Rectangle(10, 10))
+    shape.add(nanogds.Rectangle(10, 10).translate(5, 5))
+    assert len(shape.polygons[0]) == 1
+
+
+def test_pickle_keeps_hierarchy():
+    field = nanogds.MarkerField(5, 4, 3, 50, hierarchical=True)
+    field.translate(10, 20)
+    restored = pickle.loads(pickle.dumps(field))
+    assert type(restored) is nanogds.MarkerField
+    assert restored._key == field._key and np.allclose(restored._matrix, field._matrix)
+    assert len(restored._children) == len(field._children)
+    assert restored.find_points()[0] == field.find_points()[0]
+    assert [len(p) for p in restored.polygons] == [len(p) for p in field.polygons]
+
+
+def test_pickle_coplanar_shape():
+    shape = nanogds.CoplanarShape()
+    shape.add_to_ground(gdspy.Rectangle((0, 0), (100, 100)))
+    shape.add_to_center(gdspy.Rectangle((10, 10), (20, 20)))
+    shape.add_hole_array(10, 2, keepout=5)
+    restored = nanogds.CoplanarShape.from_bytes(shape.to_bytes())
+    assert restored._hole_arrays[0]._children
+    restored._center[0].polygons[0][0, 0] = 11  # a copy, changed in place
+    assert shape._center[0].polygons[0][0, 0] == 10
+    restored.translate(5, 0)
+    assert np.isclose(restored._center[0].get_bounding_box()[1, 0], 25)
+
+
+def test_find_dies_by_column():
+    names = ["A1", "AB2", "B10", "B2", "WAFER_RING"]
+    placements = [(n, (i, 0)) for i, n in enumerate(names)]
+    dies = nanogds.base.dies.DieIndex(placements)
+    assert [d.name for d in dies.find(columns="A")] == ["A1"]
+    assert [d.name for d in dies.find(columns="AB")] == ["AB2"]
+    assert [d.name for d in dies.find(columns=["A", "B"], rows=[2])] == ["B2"]
+    assert [d.name for d in dies.find(columns="W", ring=True)] == []
+
+
+def test_add_reference_by_column_prefix():
+    mask = nanogds.MaskTemplate("wafer_template_5x8mm")
+    mask.add_reference_by_columns("SQUARE", nanogds.Square(10).shapes, ["B1"])
+    square = mask._lib.cells["SQUARE"]
+    names = [
+        n
+        for n, cell in mask._lib.cells.items()
+        if any(r.ref_cell is square for r in cell.references)
+    ]
+    expected = [n for n, _ in mask.placements if n.startswith("B1")]
+    assert len(expected) > 1 and sorted(names) == sorted(expected)
+
+
+def test_gds_index_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(nanogds.base.gdsii, "MMAP_SIZE", 0)
+    path = str(tmp_path / "cells.gds")
+
+    def write(*names):
+        lib = gdspy.GdsLibrary()
+        for name in names:
+            cell = gdspy.Cell(name, exclude_from_current=True)
+            lib.add(cell.add(gdspy.Rectangle((0, 0), (1, 1))))
+        lib.write_gds(path)
+
+    write("A")
+    first = nanogds.base.gdsii.get_index(path)
+    assert nanogds.base.gdsii.get_index(path) is first
+    cell = first.get_cells("A")["A"]
+    write("A", "B")
+    second = nanogds.base.gdsii.get_index(path)
+    assert second is not first and "B" in second.cells
+    assert cell.get_bounding_box().tolist() == [[0, 0], [1, 1]]
+    with pytest.raises(Exception):
+        first.get_bytes("A")
+    nanogds.base.gdsii.clear_cache(path)
+    with pytest.raises(Exception):
+        second.get_bytes("B")
+    os.remove(path)
+
+
+def test_get_shape_results_are_not_deduplicated():
+    parent = nanogds.Shape()
+    for i, size in enumerate([100, 200]):
+        shape = nanogds.CoplanarShape()
+        shape.add_to_ground(gdspy.Rectangle((0, 0), (size, size)))
+        shape.add_to_center(gdspy.Rectangle((10, 10), (20, 20)))
+        parent.add(shape.get_shape(), position=(500 * i, 0), reference=True)
+    lib = nanogds.GDS()
+    lib.add("CHIP", parent)
+    assert np.isclose(lib._lib.cells["CHIP"].area(), 100 ** 2 + 200 ** 2)
+
+
+def test_reading_keeps_children():
+    field = nanogds.MarkerField(5, 3, 2, 50, hierarchical=True)
+    key, children = field._key, len(field._children)
+    assert field.layers == [0] and len(field.polygons[0]) > 0
+    assert field._key == key and len(field._children) == children
+    field.shapes
+    assert field._key is None and not field._children
+
+
+def test_cache_load(tmp_path, monkeypatch):
+    cache = nanogds.ShapeCache(str(tmp_path))
+    monkeypatch.setattr(nanogds.MarkerField, "cache", cache)
+    field = nanogds.MarkerField(5, 3, 2, 50, hierarchical=True)
+    assert len(os.listdir(str(tmp_path))) == 1
+    loaded = cache.load(field._key)
+    assert type(loaded) is nanogds.MarkerField and loaded._key == field._key
+    assert len(loaded._children) == len(field._children) > 0
+    assert loaded.find_points()[0] == field.find_points()[0]
+    built = nanogds.MarkerField(5, 3, 2, 50, hierarchical=True)
+    assert [len(p) for p in built.polygons] == [len(p) for p in field.polygons]
+
+
+def test_cache_eviction_and_invalidate(tmp_path):
+    cache = nanogds.ShapeCache(str(tmp_path))
+    cache.store(nanogds.Circle(10)._key, nanogds.Circle(10))
+    size = os.path.getsize(os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0]))
+    cache = nanogds.ShapeCache(str(tmp_path), max_size=int(2.5 * size))
+    for radius in [20, 30, 40]:
+        cache.store(nanogds.Circle(radius)._key, nanogds.Circle(radius))
+    assert len(os.listdir(str(tmp_path))) == 2
+    assert cache.load(nanogds.Circle(40)._key) is not None
+    cache.store(nanogds.Square(10)._key, nanogds.Square(10))
+    cache.invalidate("Circle")
+    assert [f.split("-")[0] for f in os.listdir(str(tmp_path))] == ["Square"]
+    cache.invalidate()
+    assert not os.listdir(str(tmp_path))
+
+
+def test_cached_function(tmp_path):
+    cache = nanogds.ShapeCache(str(tmp_path))
+    calls = []
+
+    @cache.cached
+    def get_square(size):
+        calls.append(size)
+        return nanogds.Square(size)
+
+    first, second = get_square(10), get_square(10)
+    assert calls == [10] and get_square.__name__ == "get_square"
+    assert [len(p) for p in second.polygons] == [len(p) for p in first.polygons]
+    get_square(20)
+    cache.invalidate(get_square.__qualname__)
+    get_square(10)
+    assert calls == [10, 20, 10]
+
+
+def get_crossed_markers(field):
+    # markers with a corner cross, whose arms end 6 to 24 um from the center
+    vertices = np.concatenate([p for polygons in field.polygons for p in polygons])
+    names, points = field.find_points("MARKER_")
+    crossed = []
+    for name, point in zip(names, points):
+        distances = np.abs(vertices - point).max(axis=1)
+        if ((distances > 6) & (distances < 24)).any():
+            crossed.append(name)
+    return sorted(crossed)
+
+
+def test_marker_field_corners():
+    field = nanogds.MarkerField(5, 4, 2, 50)
+    field.add_corners()
+    corners = ["MARKER_1_1", "MARKER_1_2", "MARKER_4_1", "MARKER_4_2"]
+    assert get_crossed_markers(field) == corners
+    sites = np.ones((4, 2), dtype=bool)
+    sites[3, 1] = False
+    field = nanogds.MarkerField(5, 4, 2, 50, sites=sites)
+    field.add_corners()
+    assert get_crossed_markers(field) == corners[:3]
+
+
+def test_get_blocks():
+    occupied = np.ones((4, 6), dtype=bool)
+    occupied[1, 2] = occupied[3, 5] = False
+    blocks = nanogds.base.raster.get_blocks(occupied)
+    covered = np.zeros(occupied.shape, dtype=int)
+    for row, column, rows, columns in blocks.T:
+        covered[row : row + rows, column : column + columns] += 1
+    assert (covered == occupied).all()
+    assert blocks.shape[1] < occupied.sum()
+    assert nanogds.base.raster.get_blocks(np.zeros((2, 2))).shape == (4, 0)
+
+
+def test_get_lattice():
+    get_lattice = nanogds.base.raster.get_lattice
+    points = [(10, 5), (30, 5), (50, 5), (10, 20), (50, 20)]
+    origin, spacing, indices = get_lattice(points)
+    assert np.allclose(origin, (10, 5)) and np.allclose(spacing, (20, 15))
+    assert indices.tolist() == [[0, 0], [1, 0], [2, 0], [0, 1], [2, 1]]
+    assert get_lattice([(0, 0), (10, 0), (25, 0)]) is None
+    assert get_lattice([(0, 0), (0, 0), (10, 0)]) is None
+    assert get_lattice([(0, 0), (1, 0), (1000, 0)]) is None
+
+
+def test_references_on_a_grid_are_cell_arrays():
+    chip = nanogds.Shape()
+    flat = nanogds.Shape()
+    for i in range(4):
+        for j in range(3):
+            if (i, j) != (3, 2):
+                position = (100 * i, 50 * j)
+                chip.add(nanogds.Square(10), position=position, reference=True)
+                flat.add(nanogds.Square(10), position=position)
+    assert len(chip._children) == 11
+    lib = nanogds.GDS()
+    lib.add("CHIP", chip)
+    cell = lib._lib.cells["CHIP"]
+    arrays = [r for r in cell.references if isinstance(r, gdspy.CellArray)]
+    assert arrays and len({id(r.ref_cell) for r in cell.references}) == 1
+    sites = sum(
+        r.columns * r.rows if isinstance(r, gdspy.CellArray) else 1
+        for r in cell.references
+    )
+    assert sites == 11
+    assert np.isclose(cell.area(), sum(p.area() for p in flat.shapes))
+
+
+def read_gds(path):
+    # cells of a file by name, with their polygons and references
+    library = gdspy.GdsLibrary(infile=path)
+    cells = {}
+    for name, cell in library.cells.items():
+        polygons = sorted(
+            (layer, np.round(p, 3).tobytes())
+            for polygonset in cell.polygons
+            for layer, p in zip(polygonset.layers, polygonset.polygons)
+        )
+        references = sorted(
+            (r.ref_cell.name, tuple(np.round(r.origin, 3)), type(r).__name__)
+            for r in cell.references
+        )
+        cells[name] = (polygons, references)
+    return cells
+
+
+def build_library(stream=None):
+    lib = nanogds.GDS()
+    if stream is not None:
+        lib.stream(stream)
+    field = nanogds.MarkerField(5, 4, 3, 50, hierarchical=True)
+    for i in range(2):
+        chip = nanogds.Shape()
+        chip.add(field, position=(1000 * i, 0), reference=True)
+        chip.add(nanogds.Rectangle(20, 10 * (i + 1)))
+        lib.add(f"CHIP{i}", chip)
+    return lib
+
+
+@pytest.mark.parametrize("early", [False, True])
+def test_streamed_file_equals_saved_file(tmp_path, early):
+    saved, streamed = str(tmp_path / "saved"), str(tmp_path / "streamed")
+    build_library().save(saved)
+    if early:
+        build_library(stream=streamed).save()
+    else:
+        build_library().save(streamed, streaming=True)
+    cells = read_gds(f"{saved}.gds")
+    assert sum(name.startswith("MARKERFIELD") for name in cells) == 1
+    assert read_gds(f"{streamed}.gds") == cells
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_populate_in_workers(tmp_path, monkeypatch, streaming):
+    mapping = {"B3": dict(w=2, l=20, g=2, n=4), "C4": dict(w=2, l=30, g=2, n=6)}
+    paths = []
+    for workers in [1, 2]:
+        # new cells are also registered in the current library
+        monkeypatch.setattr(gdspy, "current_library", gdspy.GdsLibrary())
+        mask = nanogds.MaskTemplate("wafer_template_5x8mm")
+        path = str(tmp_path / f"mask{workers}")
+        if streaming:
+            mask.stream(path)
+        mask.populate(mapping, nanogds.IDFCapacitor, workers=workers)
+        mask.write(path)
+        paths.append(f"{path}.gds")
+    cells = read_gds(paths[0])
+    assert cells["B3_SHAPE"][0] and cells["C4_SHAPE"][0] != cells["B3_SHAPE"][0]
+    assert read_gds(paths[1]) == cells
+
+
+def test_profile(tmp_path):
+    shape = nanogds.Shape()
+    with nanogds.Profile() as outer:
+        begin = time.perf_counter()
+        shape.add(nanogds.Rectangle(10, 10))
+        shape.add(nanogds.Rectangle(10, 10).translate(5, 5))
+        shape.polygons
+        with nanogds.Profile() as inner:
+            shape.translate(100, 0)
+            shape.polygons
+        shape.add(nanogds.Rectangle(10, 10).translate(105, 0))
+        shape.polygons
+        end = time.perf_counter()
+    shape.add(nanogds.Rectangle(10, 10).translate(110, 10))
+    shape.polygons
+    assert [e.phase for e in inner.events] == ["transform"]
+    assert [e.phase for e in outer.events] == ["boolean", "transform", "boolean"]
+    assert outer.events[1] == inner.events[0]
+    assert all(begin <= e.start and e.start + e.duration <= end for e in outer.events)
+    boolean = outer.events[0]
+    assert boolean.polygons_in == 2
+    assert (boolean.polygons_out, boolean.vertices_out) == (1, 8)
+
+    outer.to_json(str(tmp_path / "profile.json"))
+    with open(str(tmp_path / "profile.json")) as f:
+        data = json.load(f)
+    assert len(data["events"]) == len(outer.events)
+    assert sum(t["count"] for t in data["summary"]) == len(outer.events)
+    outer.to_chrome_trace(str(tmp_path / "trace.json"))
+    with open(str(tmp_path / "trace.json")) as f:
+        trace = json.load(f)["traceEvents"]
+    assert len(trace) == len(outer.events)
+    assert all(t["ph"] == "X" and t["ts"] >= 0 and t["dur"] >= 0 for t in trace)
+    assert {t["name"] for t in trace} >= {"boolean Shape", "transform Shape"}
+    assert all(t["args"]["layer"] == 0 for t in trace)
+
+
+def count_vertices(shape):
+    return sum(len(p) for polygons in shape.polygons for p in polygons)
+
+
+def test_tolerance(monkeypatch):
+    default = nanogds.Circle(1000)
+    monkeypatch.setattr(nanogds.Circle, "tolerance", 0.1)
+    coarse = nanogds.Circle(1000)
+    assert count_vertices(coarse) < count_vertices(default) / 2
+    assert coarse._key != default._key
+
+    def get_turn(tolerance):
+        path = nanogds.CoplanarPath(10, 6, 60, 20)
+        path.tolerance = tolerance
+        path.segment(100, "+x")
+        path.turn("l")
+        return count_vertices(path.get_shape())
+
+    assert get_turn(1) < get_turn(None) < get_turn(0.001)
+
+
+def test_tolerance_separates_cache_and_memo(tmp_path, monkeypatch):
+    cache = nanogds.ShapeCache(str(tmp_path))
+    memo = nanogds.ShapeMemo()
+    monkeypatch.setattr(nanogds.Circle, "cache", cache)
+    monkeypatch.setattr(nanogds.Circle, "memo", memo)
+    default = count_vertices(nanogds.Circle(1000))
+    monkeypatch.setattr(nanogds.Circle, "tolerance", 0.1)
+    coarse = count_vertices(nanogds.Circle(1000))
+    assert coarse < default and (memo.hits, memo.misses) == (0, 2)
+    assert len(os.listdir(str(tmp_path))) == 2
+    memo.clear()
+    assert count_vertices(nanogds.Circle(1000)) == coarse
+
+
+def is_on_grid(shape, grid):
+    vertices = np.concatenate([p for polygons in shape.polygons for p in polygons])
+    return np.allclose(vertices / grid, np.round(vertices / grid), rtol=0, atol=1e-6)
+
+
+def test_grid(monkeypatch):
+    unsnapped = nanogds.Rectangle(10, 10)
+    monkeypatch.setattr(nanogds.Shape, "grid", 0.001)
+    shape = nanogds.Shape()
+    shape.add(nanogds.Circle(10.00037), position=(0.12345, 0))
+    shape.add(nanogds.Rectangle(10, 10).rotate(0.3), position=(3, 0.1), angle=0.2)
+    shape.add(nanogds.Rectangle(2, 2).rotate(0.7), position=(50, 50))
+    assert is_on_grid(shape, 0.001)
+    shape.translate(0.0004, 1 / 3).rotate(1.1)
+    assert is_on_grid(shape, 0.001)
+    shape.add(nanogds.Cross(4, 1).rotate(0.45), position=(2, 2), operation="not")
+    assert is_on_grid(shape, 0.001)
+    assert len(shape.polygons[0]) == 2  # the small square skipped the boolean
+    assert nanogds.Rectangle(10, 10)._key != unsnapped._key